@@ -5,23 +5,43 @@ import re
 import os
 import html
 import base64
+import functools
+import contextlib
+import copy
+import hashlib
+import time
+import threading
+from collections import namedtuple, OrderedDict, deque
 from io import BytesIO
-from PIL import Image as PILImage
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.pdfgen.canvas import Canvas
-from reportlab.lib.units import cm
-from reportlab.lib.colors import Color, black, HexColor, gray
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Paragraph, ListFlowable, ListItem, Frame, Table, TableStyle
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.platypus import Frame
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPDF
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase.pdfmetrics import stringWidth
+from types import MappingProxyType
+
+# O reportlab é carregado por load_reportlab() na primeira exportação (um PDF
+# servido pelo cache de PDFs não precisa dele). As bibliotecas mais pesadas
+# são importadas só quando um bloco precisa delas: reportlab.platypus
+# (Paragraph e Table), svglib e renderPDF (ícones SVG), PIL e ImageReader
+# (imagens), TTFont (fontes Unicode) e Pygments (código).
+_reportlab_loaded = False
+
+# Carrega os nomes do reportlab usados em todo o script (uma vez por processo)
+def load_reportlab():
+    global _reportlab_loaded
+    global A4, canvas, cm, inch, black, HexColor, gray, colors
+    global TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT, stringWidth, pdfdoc, pdfmetrics, ps2tt, tt2ps
+    if _reportlab_loaded:
+        return
+
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import cm
+    from reportlab.lib.colors import black, HexColor, gray
+    from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfbase import pdfdoc
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.lib.fonts import ps2tt, tt2ps
+    _reportlab_loaded = True
 
 # --- Correção importante para Windows ---
 if os.name == 'nt':
@@ -35,22 +55,608 @@ def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS  # PyInstaller extrai tudo pra essa pasta temporária
     except AttributeError:
-        base_path = os.path.abspath(".")
+        base_path = os.path.dirname(os.path.abspath(__file__))  # pasta do script, qualquer que seja o cwd
 
     return os.path.join(base_path, relative_path)
 
+# Cache dos SVGs já convertidos (um parse por processo)
+_svg_cache = {}
+
+def load_svg(relative_path):
+    path = resource_path(relative_path)
+    if path not in _svg_cache:
+        from svglib.svglib import svg2rlg
+        _svg_cache[path] = svg2rlg(path) if os.path.exists(path) else None
+        profile_count("svg_parses")
+    return _svg_cache[path]
+
+# Desenha um ícone SVG como Form XObject (gravado uma vez por documento)
+def draw_svg_icon(c, relative_path, x, y, width, height, keep_aspect=True):
+    """
+    Desenha o ícone em (x, y) reaproveitando um Form XObject do documento.
+
+    O SVG é convertido uma única vez por processo e gravado uma única vez
+    por PDF; cada uso seguinte é apenas uma referência ao form.
+    Retorna a largura e altura desenhadas, ou None se o SVG não existir.
+    No modo rascunho desenha uma forma simples, sem ler o SVG.
+    """
+    if getattr(_render, "draft", False):
+        return draw_draft_icon(c, relative_path, x, y, width, height, keep_aspect)
+
+    drawing = load_svg(relative_path)
+    if not drawing:
+        return None
+
+    # Escala proporcional ou ajustada para width x height
+    scale_x = width / drawing.width
+    scale_y = height / drawing.height
+    if keep_aspect:
+        scale_x = scale_y = min(width, height) / max(drawing.width, drawing.height)
+
+    icon_width = drawing.width * scale_x
+    icon_height = drawing.height * scale_y
+
+    name = re.sub(r'\W', '_', f"Icon_{os.path.splitext(os.path.basename(relative_path))[0]}_{icon_width:g}x{icon_height:g}")
+    if not c.hasForm(name):
+        from reportlab.graphics import renderPDF
+
+        c.beginForm(name, 0, 0, icon_width, icon_height)
+        c.scale(scale_x, scale_y)
+        renderPDF.draw(drawing, c, 0, 0)
+        c.endForm()
+
+    c.saveState()
+    c.translate(x, y)
+    c.doForm(name)
+    c.restoreState()
+
+    return icon_width, icon_height
+
+# Rascunho de um ícone: contorno no mesmo espaço (caixa, caixa marcada ou triângulo)
+def draw_draft_icon(c, relative_path, x, y, width, height, keep_aspect=True):
+    if keep_aspect:
+        width = height = min(width, height)
+    name = os.path.splitext(os.path.basename(relative_path))[0]
+
+    c.saveState()
+    c.setStrokeColor(gray)
+    c.setLineWidth(1)
+    if name == "warning":
+        path = c.beginPath()
+        path.moveTo(x, y)
+        path.lineTo(x + width, y)
+        path.lineTo(x + width / 2, y + height)
+        path.close()
+        c.drawPath(path)
+    else:
+        c.rect(x, y, width, height)
+        if name == "checked":
+            c.lines([(x + width * 0.2, y + height * 0.5, x + width * 0.4, y + height * 0.25),
+                     (x + width * 0.4, y + height * 0.25, x + width * 0.8, y + height * 0.8)])
+    c.restoreState()
+    return width, height
+
+# Alinhamentos aceitos pelo Editor.js
+ALIGNMENTS = ('left', 'center', 'right')
+
+# Registro de estilos (montado uma única vez por processo)
+_styles = None
+
+def build_styles():
+    """
+    Monta todos os estilos nomeados usados pelos renderizadores.
+
+    Retorna um mapeamento somente leitura: os renderizadores apenas consultam
+    os estilos e nunca os alteram. Para variações (temas), derive um novo
+    ParagraphStyle usando o estilo registrado como parent.
+    """
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    body = getSampleStyleSheet()['BodyText']
+
+    styles = {
+        'paragraph': ParagraphStyle(
+            'Paragraph',
+            parent=body,
+            fontName='Times-Roman',
+            fontSize=12,
+            leading=15,
+            alignment=TA_JUSTIFY,
+            textColor=black,
+        ),
+        'list_item': ParagraphStyle(
+            'ListItem',
+            parent=body,
+            fontName='Helvetica',
+            fontSize=12,
+            leading=12,
+            alignment=TA_LEFT,
+        ),
+        'checklist_item': ParagraphStyle(
+            'ChecklistItem',
+            parent=body,
+            fontName='Helvetica',
+            fontSize=12,
+            leading=15,
+            alignment=TA_LEFT,
+        ),
+        'warning': ParagraphStyle(
+            'WarningStyle',
+            parent=body,
+            fontName='Helvetica',
+            fontSize=13,
+            leading=18,
+            alignment=TA_LEFT,
+            textColor=colors.black,
+        ),
+        'code': ParagraphStyle(
+            'CodeStyle',
+            fontName='Courier',  # Monoespaçada
+            fontSize=10.5,
+            leading=14,
+            textColor=colors.white,
+            alignment=TA_LEFT,
+            leftIndent=0,
+            rightIndent=0,
+            spaceAfter=0,
+            spaceBefore=0,
+        ),
+    }
+
+    # Citações e legendas existem em uma variação para cada alinhamento
+    alignments = {'left': TA_LEFT, 'center': TA_CENTER, 'right': TA_RIGHT}
+    for align_name in ALIGNMENTS:
+        alignment = alignments[align_name]
+        styles[f'quote_{align_name}'] = ParagraphStyle(
+            'Quote',
+            fontName='Helvetica-Oblique',
+            fontSize=14,
+            leading=18,
+            textColor=black,
+            alignment=alignment,
+            spaceAfter=6,
+        )
+        styles[f'caption_{align_name}'] = ParagraphStyle(
+            'QuoteCaption',
+            fontName='Helvetica',
+            fontSize=10,
+            leading=12,
+            textColor=black,
+            alignment=alignment,
+        )
+
+    # Células de tabela com texto Unicode (mesma fonte e altura de linha da tabela)
+    styles['table_cell'] = ParagraphStyle(
+        'TableCell',
+        fontName='Helvetica',
+        fontSize=12,
+        leading=14.4,
+        textColor=black,
+        alignment=TA_CENTER,
+    )
+
+    return MappingProxyType(styles)
+
+def get_style(name):
+    global _styles
+    if _styles is None:
+        _styles = build_styles()
+    return _styles[name]
+
+# Caracteres fora do WinAnsi, que as fontes padrão do PDF (Type 1) não desenham
+_WINANSI_EXTRA = bytes(range(0x80, 0xA0)).decode('cp1252', errors='ignore')
+NON_WINANSI_CHARS = r'[^\x00-\x7F\xA0-\xFF' + re.escape(_WINANSI_EXTRA) + ']'
+_non_winansi = re.compile(NON_WINANSI_CHARS + '+')
+
+# Fontes TrueType para os caracteres fora do WinAnsi, testadas na ordem.
+# Cada item é (regular, negrito); os arquivos são procurados em assets/fonts
+# e depois nas pastas de fontes do sistema.
+UNICODE_FONTS = [
+    # Latim estendido, grego, cirílico, hebraico e símbolos
+    ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf'),
+    ('NotoSans-Regular.ttf', 'NotoSans-Bold.ttf'),
+    ('arial.ttf', 'arialbd.ttf'),
+    ('Arial Unicode.ttf', None),
+    ('seguisym.ttf', None),
+    # Chinês, japonês e coreano
+    ('msyh.ttc', 'msyhbd.ttc'),
+    ('simsun.ttc', None),
+    ('msgothic.ttc', None),
+    ('malgun.ttf', 'malgunbd.ttf'),
+    ('wqy-microhei.ttc', None),
+    ('wqy-zenhei.ttc', None),
+    ('DroidSansFallbackFull.ttf', None),
+    ('DroidSansFallback.ttf', None),
+]
+
+# Blocos de código tentam primeiro uma fonte monoespaçada
+MONO_FONTS = [
+    ('DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf'),
+    ('NotoSansMono-Regular.ttf', 'NotoSansMono-Bold.ttf'),
+    ('consola.ttf', 'consolab.ttf'),
+    ('cour.ttf', 'courbd.ttf'),
+]
+
+# Pastas onde as fontes TrueType são procuradas (assets/fonts tem prioridade)
+def font_dirs():
+    dirs = [resource_path("assets/fonts")]
+    if os.name == 'nt':
+        dirs.append(os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'))
+        dirs.append(os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts'))
+    elif sys.platform == 'darwin':
+        dirs += ['/System/Library/Fonts', '/System/Library/Fonts/Supplemental', '/Library/Fonts',
+                 os.path.expanduser('~/Library/Fonts')]
+    else:
+        dirs += ['/usr/share/fonts', '/usr/local/share/fonts',
+                 os.path.expanduser('~/.local/share/fonts'), os.path.expanduser('~/.fonts')]
+    return dirs
+
+# Índice nome do arquivo -> caminho (as pastas são varridas uma vez por processo).
+# A busca e o registro das fontes ficam sob um lock: exportações em threads
+# (AsyncExporter) nunca veem o índice pela metade nem registram a mesma fonte duas vezes.
+_font_files = None
+_font_lock = threading.RLock()
+
+def find_font_file(file_name):
+    global _font_files
+    if _font_files is None:
+        with _font_lock:
+            if _font_files is None:
+                found = {}
+                for directory in font_dirs():
+                    for root, _, files in os.walk(directory):
+                        for name in files:
+                            found.setdefault(name.lower(), os.path.join(root, name))
+                _font_files = found  # publicado só depois de completo
+    return _font_files.get(file_name.lower())
+
+# Fontes já registradas: (regular, negrito) -> resultado de register_ttf
+_ttf_fonts = {}
+
+# Registra uma fonte TrueType no reportlab (uma vez por processo)
+def register_ttf(regular, bold=None):
+    """
+    Retorna (nome da fonte, códigos cobertos) ou None se o arquivo não existir.
+
+    O reportlab grava no PDF apenas os glifos usados (subconjunto por
+    documento). Sem o arquivo em negrito, o negrito usa a fonte regular.
+    """
+    key = (regular, bold)
+    if key not in _ttf_fonts:
+        with _font_lock:
+            if key not in _ttf_fonts:
+                _ttf_fonts[key] = load_ttf(regular, bold)
+    return _ttf_fonts[key]
+
+def load_ttf(regular, bold):
+    path = find_font_file(regular)
+    if not path:
+        return None
+
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    name = "TTF-" + os.path.splitext(os.path.basename(path))[0]
+    try:
+        font = TTFont(name, path)
+        pdfmetrics.registerFont(font)
+    except Exception as e:
+        print(f"[Error]: When loading font {path}: {e}", file=sys.stderr)
+        return None
+
+    bold_name = name
+    bold_path = find_font_file(bold) if bold else None
+    if bold_path:
+        try:
+            pdfmetrics.registerFont(TTFont(name + "-Bold", bold_path))
+            bold_name = name + "-Bold"
+        except Exception as e:
+            print(f"[Error]: When loading font {bold_path}: {e}", file=sys.stderr)
+
+    # Itálico não tem arquivo próprio: <i> dentro do trecho usa a fonte regular
+    pdfmetrics.registerFontFamily(name, normal=name, bold=bold_name, italic=name, boldItalic=bold_name)
+    return name, frozenset(font.face.charToGlyph)
+
+# Fontes Unicode, na ordem de preferência
+def font_specs(mono=False):
+    return (MONO_FONTS if mono else []) + UNICODE_FONTS
+
+# Verifica se alguma fonte da cadeia está instalada (só procura os arquivos, sem carregá-los)
+@functools.lru_cache(maxsize=None)
+def has_unicode_fonts(mono=False):
+    return any(find_font_file(regular) for regular, _ in font_specs(mono))
+
+# Primeira fonte Unicode que tem o glifo do caractere (None se nenhuma tiver)
+@functools.lru_cache(maxsize=65536)
+def font_for_char(char, mono=False):
+    """
+    As fontes são carregadas sob demanda, descendo a cadeia: a busca para
+    na primeira que cobre o caractere, então as seguintes (como os .ttc
+    grandes de CJK) só são lidas quando um caractere precisa delas.
+    """
+    code = ord(char)
+    for spec in font_specs(mono):
+        font = register_ttf(*spec)
+        if font and code in font[1]:
+            return font[0]
+    return None
+
+# Divide um trecho fora do WinAnsi em pedaços (fonte, texto)
+def unicode_runs(text, mono=False):
+    """
+    Cada caractere vai para a primeira fonte da cadeia que o cobre e
+    caracteres sem nenhuma fonte são removidos. Sem nenhuma fonte Unicode
+    instalada, vale o filtro antigo (fonte None = fonte padrão do bloco).
+    """
+    if not has_unicode_fonts(mono):
+        text = _unsupported_chars.sub('', text)
+        return [(None, text)] if text else []
+
+    runs = []
+    for char in text:
+        name = font_for_char(char, mono)
+        if name is None:
+            continue
+        if runs and runs[-1][0] == name:
+            runs[-1][1].append(char)
+        else:
+            runs.append((name, [char]))
+    return [(name, ''.join(chars)) for name, chars in runs]
+
+# Divide um texto simples em pedaços (fonte, texto) para desenhar no canvas
+def text_runs(text, font_name, mono=False):
+    if text.isascii():
+        return [(font_name, text)] if text else []
+
+    # A fonte Unicode segue o negrito da fonte padrão (ex.: Helvetica-Bold)
+    _, bold, _ = ps2tt(font_name)
+
+    runs = []
+    pos = 0
+    for match in _non_winansi.finditer(text):
+        if match.start() > pos:
+            runs.append((font_name, text[pos:match.start()]))
+        for name, part in unicode_runs(match.group(), mono):
+            runs.append((tt2ps(name, bold, 0) if name else font_name, part))
+        pos = match.end()
+    if pos < len(text):
+        runs.append((font_name, text[pos:]))
+    return runs
+
+# Converte um trecho fora do WinAnsi para o markup do Paragraph
+def unicode_markup(text, bold=0, italic=0):
+    load_reportlab()  # sanitize_html também é usado fora da exportação
+    # <font face> zera negrito e itálico, então a face já vai com a variação certa
+    return ''.join(part if name is None else f'<font face="{tt2ps(name, bold, italic)}">{part}</font>'
+                   for name, part in unicode_runs(text))
+
+# Largura de um texto (em cache, usada nas medidas repetidas)
+@functools.lru_cache(maxsize=16384)
+def text_width(text, font_name, font_size):
+    return stringWidth(text, font_name, font_size)
+
+# Largura total de uma lista de pedaços (fonte, texto)
+def runs_width(runs, font_size):
+    return sum(text_width(part, name, font_size) for name, part in runs)
+
+# Desenha os pedaços (fonte, texto) lado a lado a partir de (x, y)
+def draw_text_runs(c, x, y, runs, font_size):
+    for name, part in runs:
+        c.setFont(name, font_size)
+        c.drawString(x, y, part)
+        x += text_width(part, name, font_size)
+
+# Erros da exportação usada como biblioteca (função export e AsyncExporter)
+class ExportError(Exception):
+    """Erro base da exportação."""
+
+class DocumentError(ExportError):
+    """O JSON não pôde ser lido ou não é um documento do Editor.js válido."""
+
+class RenderError(ExportError):
+    """Falha ao gerar o PDF a partir de um documento válido."""
+
+class ExportCancelled(ExportError):
+    """A exportação foi cancelada antes de terminar."""
+
+class ExportBusy(ExportError):
+    """Há exportações demais esperando; tente de novo mais tarde."""
+
 # Load JSON file:
 def load_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
-# Função para desenhar cabeçalhos (h1 a h6)
-def render_header(c, block_data, current_y, page_width, page_height, margin):
+# Valida a estrutura mínima do JSON do Editor.js
+def validate_document(data):
+    # Checa se o JSON não está vazio
+    if not data:
+        raise ValueError("JSON file is empty.")
+
+    # Checa se existe a chave "blocks" dentro do JSON e ela não está vazia
+    if "blocks" not in data or not data["blocks"]:
+        raise ValueError('JSON file not have "blocks" key.')
+
+# Tamanho mínimo de cada leitura no modo streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Lê o array "blocks" do JSON um bloco por vez (modo streaming)
+def iter_blocks(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Percorre o array "blocks" sem carregar o arquivo inteiro na memória.
+
+    Cada bloco é decodificado apenas quando é pedido e descartado pelo
+    chamador depois de desenhado, então o pico de memória depende do maior
+    bloco (ex.: uma imagem base64) e não do documento inteiro.
+    As demais chaves do objeto raiz ("time", "version", ...) são ignoradas.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill(min_size):
+            nonlocal buffer, pos, eof
+            chunk = file.read(max(chunk_size, min_size))
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        # Pula espaços e retorna o próximo caractere ('' no fim do arquivo)
+        def peek():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return buffer[pos:pos + 1]
+                fill(0)
+
+        def expect(chars):
+            nonlocal pos
+            char = peek()
+            if not char or char not in chars:
+                raise ValueError(f"Invalid JSON: expected one of {chars!r}, found {char!r}.")
+            pos += 1
+            return char
+
+        # Decodifica o próximo valor, lendo mais do arquivo se ele estiver incompleto
+        def read_value():
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buffer, pos)
+                    # Números podem continuar no próximo pedaço do arquivo
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return obj
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # Dobra a leitura para manter o custo linear em blocos grandes
+                fill(len(buffer) - pos)
+
+        if peek() == '':
+            raise ValueError("JSON file is empty.")
+        expect('{')
+        if peek() == '}':
+            raise ValueError("JSON file is empty.")
+
+        found_blocks = False
+        while True:
+            key = read_value()
+            if not isinstance(key, str):
+                raise ValueError("Invalid JSON: object keys must be strings.")
+            expect(':')
+
+            if key == 'blocks' and peek() == '[':
+                pos += 1
+                if peek() == ']':
+                    pos += 1
+                else:
+                    while True:
+                        found_blocks = True
+                        yield read_value()
+                        if expect(',]') == ']':
+                            break
+            else:
+                read_value()
+
+            if expect(',}') == '}':
+                break
+
+        if not found_blocks:
+            raise ValueError('JSON file not have "blocks" key.')
+
+# Abre o documento: carregado inteiro e validado, ou em modo streaming
+def open_document(json_path, stream=False):
+    if stream:
+        return {"blocks": iter_blocks(json_path)}
+
+    data = load_json(json_path)
+    validate_document(data)
+    return data
+
+# Abre vários JSONs para um único PDF; retorna os documentos e a pasta de cada um
+def open_documents(json_paths, stream=False):
+    documents = [open_document(json_path, stream=stream) for json_path in json_paths]
+    return documents, [os.path.dirname(os.path.abspath(json_path)) for json_path in json_paths]
+
+# Fragmento de layout: um pedaço de bloco já medido, pronto para desenhar
+#   need: altura mínima livre exigida na página (senão quebra a página)
+#   advance: quanto o cursor desce depois de desenhar (inclui o espaço após o bloco)
+#   draw(c, y): desenha o fragmento com o topo em y
+#   space_before: espaço antes do fragmento, descartado logo após uma quebra de página
+#   split(avail): divide o fragmento em (cabeça, resto) para caber em `avail`, ou None
+Fragment = namedtuple('Fragment', 'need advance draw space_before split', defaults=(0, None))
+
+# Cria o fragmento de um Paragraph já montado (divisível entre páginas)
+def paragraph_fragment(para, x, width, max_height, gap, size=None):
+    w, h = size or para.wrap(width, max_height)
+
+    def draw(c, y):
+        para.drawOn(c, x, y - h)
+
+    def split(avail):
+        parts = para.split(width, avail)
+        if len(parts) < 2:
+            return None
+        head, tail = parts
+        return paragraph_fragment(head, x, width, max_height, 0), paragraph_fragment(tail, x, width, max_height, gap)
+
+    return Fragment(need=h, advance=h + gap, draw=draw, split=split)
+
+# Parágrafos já medidos, por (texto sanitizado, estilo, largura, altura máxima).
+# Linhas de modelo, itens de lista e checklists copiados se repetem muito nas
+# notas: as linhas já quebradas são reaproveitadas. O Paragraph guardado
+# nunca é entregue: o reportlab altera o objeto ao desenhar (canv) e ao
+# dividir (blPara), então cada uso recebe uma cópia rasa dele.
+WRAP_CACHE_SIZE = 4096
+WRAP_CACHE_MAX_TEXT = 2000  # textos maiores raramente se repetem e não entram no cache
+
+@functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _wrap_paragraph(text, style, width, max_height):
+    from reportlab.platypus import Paragraph
+
+    para = Paragraph(text, style)
+    return para, para.wrap(width, max_height)
+
+# Monta e mede o Paragraph; retorna (para, (w, h)) com um Paragraph só de quem chamou
+def wrap_paragraph(text, style, width, max_height):
+    if len(text) > WRAP_CACHE_MAX_TEXT:
+        from reportlab.platypus import Paragraph
+
+        para = Paragraph(text, style)
+        return para, para.wrap(width, max_height)
+
+    if _profile is None:
+        para, size = _wrap_paragraph(text, style, width, max_height)
+    else:
+        misses = _wrap_paragraph.cache_info().misses
+        para, size = _wrap_paragraph(text, style, width, max_height)
+        profile_count("wrap_cache_misses" if _wrap_paragraph.cache_info().misses > misses else "wrap_cache_hits")
+    return copy.copy(para), size
+
+wrap_paragraph.cache_clear = _wrap_paragraph.cache_clear
+
+# Estatísticas do cache de parágrafos deste processo
+def wrap_cache_stats():
+    info = _wrap_paragraph.cache_info()
+    lookups = info.hits + info.misses
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize, "max_entries": info.maxsize,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else None}
+
+# Função para medir cabeçalhos (h1 a h6)
+def measure_header(block_data, page_width, page_height, margin):
     level = block_data.get('level', 1)
-    text = re.sub(r'[^\x00-\x7FÀ-ÿ\u00A0-\u00FF\s\w.,;:!?\'"()<>/@&%$#=+\-\[\]{}*]', '',block_data.get('text', '').strip())
+    runs = text_runs(block_data.get('text', '').strip(), "Helvetica-Bold")
+    text = ''.join(part for _, part in runs)
 
     if not text:
-        return current_y  # Nada pra desenhar
+        return []  # Nada pra desenhar
 
     if level == 1:
         font_size = 32
@@ -60,253 +666,279 @@ def render_header(c, block_data, current_y, page_width, page_height, margin):
     line_spacing = 1.2
     x_margin = margin
 
-    if current_y < margin + font_size:
-        c.showPage()
-        current_y = page_height - margin
-
-    c.setFont("Helvetica-Bold", font_size)
-    c.setFillColor(black)
-    c.drawString(x_margin, current_y, text)
-    current_y -= font_size * line_spacing
-
-    return current_y
+    def draw(c, y):
+        c.setFillColor(black)
+        draw_text_runs(c, x_margin, y, runs, font_size)
+
+    return [Fragment(need=font_size, advance=font_size * line_spacing, draw=draw)]
+
+# Caracteres removidos do texto quando nenhuma fonte Unicode é encontrada
+UNSUPPORTED_CHARS = r'[^\x00-\x7FÀ-ÿ\u00A0-\u00FF\s\w.,;:!?\'"()<>/@&%$#=+\-\[\]{}*]'
+_unsupported_chars = re.compile(UNSUPPORTED_CHARS)
+
+# Tags inline do Editor.js e o equivalente aceito pelo Paragraph do reportlab
+INLINE_TAGS = {
+    'b': ('<b>', '</b>'),
+    'strong': ('<b>', '</b>'),
+    'i': ('<i>', '</i>'),
+    'em': ('<i>', '</i>'),
+    'u': ('<u>', '</u>'),
+    'mark': ('<u>', '</u>'),
+    's': ('<strike>', '</strike>'),
+    'strike': ('<strike>', '</strike>'),
+    'del': ('<strike>', '</strike>'),
+    'sub': ('<sub>', '</sub>'),
+    'sup': ('<super>', '</super>'),
+    'code': ('<font face="Courier">', '</font>'),
+}
+
+# Um único tokenizador: tags, &nbsp; e trechos fora do WinAnsi.
+# Textos só com ASCII usam a versão sem a classe de caracteres (mais rápida).
+_HTML_TAG = r'<(/?)\s*([a-zA-Z][a-zA-Z0-9]*)([^>]*)>|&nbsp;'
+_html_token = re.compile(_HTML_TAG + '|' + NON_WINANSI_CHARS + '+')
+_html_token_ascii = re.compile(_HTML_TAG)
+_href_attr = re.compile(r'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+
+# Quantidade de textos sanitizados mantidos em memória
+SANITIZE_CACHE_SIZE = 8192
 
 # Função para Sanitizar o texto do parágrgafo antes de desenhar
+@functools.lru_cache(maxsize=SANITIZE_CACHE_SIZE)
+def _sanitize_html(text):
+    """
+    Converte o HTML inline do Editor.js para o markup do Paragraph em uma passada.
+
+    Só as tags de INLINE_TAGS, <a href> e <br> são mantidas (atributos como
+    class são descartados); tags desconhecidas são removidas, mas o texto
+    delas é preservado. Tags abertas são fechadas no fim, então o reportlab
+    nunca recebe markup desbalanceado. Caracteres fora do WinAnsi vão para
+    uma fonte Unicode embutida. Textos repetidos vêm do cache.
+    """
+    if text.isascii():
+        if '<' not in text and '&' not in text:
+            return text
+        tokens = _html_token_ascii.finditer(text)
+    else:
+        tokens = _html_token.finditer(text)
+
+    out = []
+    open_tags = []  # (nome, tag de fechamento)
+    pos = 0
+
+    for match in tokens:
+        out.append(text[pos:match.start()])
+        pos = match.end()
+
+        closing, name, attributes = match.groups()
+        if name is None:
+            # &nbsp; vira espaço; trechos fora do WinAnsi trocam de fonte
+            if match.group() == '&nbsp;':
+                out.append(' ')
+            else:
+                tags = {tag for tag, _ in open_tags}
+                out.append(unicode_markup(match.group(), int(bool(tags & {'b', 'strong'})), int(bool(tags & {'i', 'em'}))))
+            continue
+
+        name = name.lower()
+        if name == 'br':
+            out.append('<br />')
+        elif closing:
+            # Fecha a tag (e as que ficaram abertas dentro dela)
+            for index in range(len(open_tags) - 1, -1, -1):
+                if open_tags[index][0] == name:
+                    while len(open_tags) > index:
+                        out.append(open_tags.pop()[1])
+                    break
+        elif name == 'a':
+            # Links em azul e sublinhados
+            href = _href_attr.search(attributes)
+            if href:
+                url = _unsupported_chars.sub('', href.group(1) if href.group(1) is not None else href.group(2))
+                out.append(f'<font color="blue"><u><a href="{url}">')
+                open_tags.append(('a', '</a></u></font>'))
+        elif name in INLINE_TAGS:
+            opening, closing_tag = INLINE_TAGS[name]
+            out.append(opening)
+            open_tags.append((name, closing_tag))
+
+    out.append(text[pos:])
+    while open_tags:
+        out.append(open_tags.pop()[1])
+
+    return ''.join(out)
+
+# Sanitiza o texto; com o perfil ligado, soma o tempo gasto ao bloco atual
 def sanitize_html(text):
-    # Remove atributos class e outros inválidos
-    text = re.sub(r'\sclass="[^"]*"', '', text)
-
-    # Corrige <br> para <br />
-    text = re.sub(r'<\s*br\s*>', '<br />', text, flags=re.IGNORECASE)
-
-    # Substituições manuais
-    text = text.replace('<code>', '<font face="Courier">').replace('</code>', '</font>')
-    text = text.replace('<mark>', '<u>').replace('</mark>', '</u>')
-    text = text.replace('&nbsp;', ' ')
-
-    # Envolver <a> com cor azul e sublinhado
-    text = re.sub(
-        r'<a href="([^"]+)">([^<]+)</a>',
-        r'<font color="blue"><u><a href="\1">\2</a></u></font>',
-        text
-    )
+    if _profile is None:
+        return _sanitize_html(text)
 
-    # Remove caracteres "estranhos" ou não compatíveis com a fonte
-    text = re.sub(r'[^\x00-\x7FÀ-ÿ\u00A0-\u00FF\s\w.,;:!?\'"()<>/@&%$#=+\-\[\]{}*]', '', text)
+    start = time.perf_counter()
+    try:
+        return _sanitize_html(text)
+    finally:
+        elapsed = time.perf_counter() - start
+        _profile["phases"]["sanitize"] += elapsed
+        if _profile["current"] is not None:
+            _profile["current"]["sanitize_ms"] += elapsed * 1000
 
-    return text
+sanitize_html.cache_clear = _sanitize_html.cache_clear
+sanitize_html.cache_info = _sanitize_html.cache_info
 
-# Função para desenhar parágrafos (b, i, u, a, mark...)
-def render_paragraph(c, data, current_y, page_width, page_height, margin):
+# Função para medir parágrafos (b, i, u, a, mark...)
+def measure_paragraph(data, page_width, page_height, margin):
 
     text = data.get("text", "")
     if not text:
-        return current_y
+        return []
 
     text = sanitize_html(text)
 
-    # Cria estilo de parágrafo
-    style = getSampleStyleSheet()['BodyText']
-    style.fontSize = 12
-    style.leading = 15
-    style.alignment = TA_JUSTIFY
-    style.textColor = black
-    style.fontName = 'Times-Roman'
+    style = get_style('paragraph')
+    width, max_height = page_width - 2 * margin, page_height - 2 * margin
 
     # Usa Platypus Paragraph para interpretar HTML básico (b, i, u, a, mark...)
-    para = Paragraph(text, style)
-
     try:
-        para = Paragraph(text, style)
+        para, size = wrap_paragraph(text, style, width, max_height)
     except Exception as e:
         print("[Error]: Error when creating paragraph:", e, file=sys.stderr)
-        return current_y
-
-    # Calcula altura do parágrafo
-    w, h = para.wrap(page_width - 2 * margin, page_height - 2 * margin)
-    if current_y - h < margin:
-        c.showPage()
-        current_y = page_height - margin
+        return []
 
-    # Desenha o parágrafo diretamente no canvas (sem Frame)
-    para.drawOn(c, margin, current_y - h)
+    # Parágrafos mais altos que a página são divididos entre páginas
+    return [paragraph_fragment(para, margin, width, max_height, 0.3 * cm, size)]  # margem inferior entre blocos
 
-    return current_y - h - 0.3 * cm  # margem inferior entre blocos
-
-# Função para renderizar listagens
-def render_list(c, block_data, current_y, page_width, page_height, margin):
+# Função para medir listagens
+def measure_list(block_data, page_width, page_height, margin):
     items = block_data.get("items", [])
     style = block_data.get("style", "unordered")  # 'ordered' ou 'unordered'
 
     if not items:
-        return current_y
-
-    current_y -= 12
+        return []
 
-    stylesheet = getSampleStyleSheet()
-    item_style = stylesheet['BodyText']
-    item_style.fontSize = 12
-    item_style.leading = 12
-    item_style.alignment = TA_LEFT
-    item_style.fontName = 'Helvetica'
+    item_style = get_style('list_item')
 
     bullet_indent = margin
     text_indent = margin + 15
     spacing = 1.0  # espaçamento entre itens
 
-    for idx, item in enumerate(items):
-        if current_y < margin + item_style.leading * spacing:
-            c.showPage()
-            current_y = page_height - margin
+    # Ajuste fino de alinhamento com base no leading/fontSize
+    baseline_offset = (item_style.leading - item_style.fontSize) / 2
 
+    fragments = []
+    for idx, item in enumerate(items):
         bullet = f"{idx + 1}." if style == "ordered" else "•"
 
-        # Desenha o bullet manualmente
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(bullet_indent, current_y, bullet)
-
-        # Desenha o texto como Paragraph
+        # Mede o texto como Paragraph
         text = sanitize_html(item)
-        para = Paragraph(text, item_style)
-        w, h = para.wrap(page_width - (text_indent + margin), page_height)
+        para, (w, h) = wrap_paragraph(text, item_style, page_width - (text_indent + margin), page_height)
 
-        # Ajuste fino de alinhamento com base no leading/fontSize
-        baseline_offset = (item_style.leading - item_style.fontSize) / 2
-        y_offset = current_y - h + baseline_offset
-        
-        para.drawOn(c, text_indent, (y_offset + 12))
+        def draw(c, y, bullet=bullet, para=para, h=h):
+            # Desenha o bullet manualmente
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(bullet_indent, y, bullet)
 
-        current_y -= h * spacing
+            y_offset = y - h + baseline_offset
+            para.drawOn(c, text_indent, (y_offset + 12))
 
-    return current_y - 0.1 * cm
+        fragments.append(Fragment(
+            need=item_style.leading * spacing,
+            advance=h * spacing,
+            draw=draw,
+            space_before=12 if idx == 0 else 0,
+        ))
 
-# Função para renderizar checklists
-def render_checklist(c, block_data, current_y, page_width, page_height, margin):
+    # Espaço após a lista
+    fragments[-1] = fragments[-1]._replace(advance=fragments[-1].advance + 0.1 * cm)
+    return fragments
+
+# Função para medir checklists
+def measure_checklist(block_data, page_width, page_height, margin):
     items = block_data.get("items", [])
 
     if not items:
-        return current_y
-
-    current_y -= 12
+        return []
 
     # Caminhos para os SVGs
-    checked_icon = resource_path("assets/checked.svg")
-    unchecked_icon = resource_path("assets/unchecked.svg")
+    checked_icon = "assets/checked.svg"
+    unchecked_icon = "assets/unchecked.svg"
     icon_size = 12  # tamanho em pontos
     icon_indent = margin
 
-    stylesheet = getSampleStyleSheet()
-    item_style = stylesheet['BodyText']
-    item_style.fontSize = 12
-    item_style.leading = 15
-    item_style.alignment = TA_LEFT
-    item_style.fontName = 'Helvetica'
+    item_style = get_style('checklist_item')
 
     text_indent = icon_indent + icon_size + 5
     spacing = 1.5
 
-    def draw_svg_icon(path, x, y, size):
-        drawing = svg2rlg(path)
-        if not drawing:
-            return
-        # Escala proporcional
-        scale = size / max(drawing.width, drawing.height)
-        drawing.scale(scale, scale)
-        # Alinha o ícone com a linha de base do texto
-        y_adjusted = y - (size * 0.2)
-        renderPDF.draw(drawing, c, x, y_adjusted)
-
-    for item in items:
-        if current_y < margin + item_style.leading * spacing:
-            c.showPage()
-            current_y = page_height - margin
-
+    fragments = []
+    for idx, item in enumerate(items):
         icon_path = checked_icon if item.get("checked") else unchecked_icon
 
-        # Desenha o SVG do ícone
-        draw_svg_icon(icon_path, icon_indent, current_y, icon_size)
-
         # Texto ao lado do ícone
         text = sanitize_html(item.get("text", ""))
-        para = Paragraph(text, item_style)
-        w, h = para.wrap(page_width - text_indent - margin, page_height)
-        para.drawOn(c, text_indent, current_y - h + 12)
-
-        current_y -= h * spacing
-
-    return current_y - 0.1 * cm
-
-# Função para renderizar os Quotes
-def render_quote(c, block_data, current_y, page_width, page_height, margin):
+        para, (w, h) = wrap_paragraph(text, item_style, page_width - text_indent - margin, page_height)
+
+        def draw(c, y, icon_path=icon_path, para=para, h=h):
+            # Desenha o SVG do ícone (alinhado com a linha de base do texto)
+            draw_svg_icon(c, icon_path, icon_indent, y - (icon_size * 0.2), icon_size, icon_size)
+            para.drawOn(c, text_indent, y - h + 12)
+
+        fragments.append(Fragment(
+            need=item_style.leading * spacing,
+            advance=h * spacing,
+            draw=draw,
+            space_before=12 if idx == 0 else 0,
+        ))
+
+    # Espaço após a lista
+    fragments[-1] = fragments[-1]._replace(advance=fragments[-1].advance + 0.1 * cm)
+    return fragments
+
+# Função para medir os Quotes
+def measure_quote(block_data, page_width, page_height, margin):
     quote_text = block_data["text"]
     caption = block_data.get("caption", "")
     alignment = block_data.get("alignment", "left")
 
     padding = 10
     box_width = page_width - 2 * margin
-    max_box_height = page_height - current_y - margin
-
-    # Estilo do texto da citação
-    quote_style = ParagraphStyle(
-        'Quote',
-        fontName='Helvetica-Oblique',
-        fontSize=14,
-        leading=18,
-        textColor=black,
-        alignment={'left': TA_LEFT, 'center': TA_CENTER, 'right': TA_RIGHT}.get(alignment, TA_LEFT),
-        spaceAfter=6,
-    )
+    max_box_height = page_height - 2 * margin
 
-    caption_style = ParagraphStyle(
-        'QuoteCaption',
-        fontName='Helvetica',
-        fontSize=10,
-        leading=12,
-        textColor=black,
-        alignment=quote_style.alignment,
-    )
+    # Estilos do texto da citação e da legenda
+    if alignment not in ALIGNMENTS:
+        alignment = 'left'
+    quote_style = get_style(f'quote_{alignment}')
+    caption_style = get_style(f'caption_{alignment}')
 
     # Parágrafos
-    quote_para = Paragraph(f'“{quote_text}”', quote_style)
-    caption_para = Paragraph(f'- {caption}', caption_style) if caption else None
+    from reportlab.platypus import Paragraph
+
+    quote_para = Paragraph(f'“{sanitize_html(quote_text)}”', quote_style)
+    caption_para = Paragraph(f'- {sanitize_html(caption)}', caption_style) if caption else None
 
     # Calcula altura total da caixa
     quote_width, quote_height = quote_para.wrap(box_width - 2 * padding, max_box_height)
     caption_width, caption_height = (caption_para.wrap(box_width - 2 * padding, max_box_height) if caption else (0, 0))
     total_height = quote_height + caption_height + 2 * padding
 
-    if current_y - total_height < margin:
-        c.showPage()
-        current_y = page_height - margin
-
-    # Desenha a "caixa" amarela
-    box_y = current_y - total_height
-    c.setFillColor(HexColor("#FFF9C4"))  # amarelo clarinho
-    c.rect(margin, box_y, box_width, total_height, fill=1, stroke=0)
+    def draw(c, y):
+        # Desenha a "caixa" amarela
+        box_y = y - total_height
+        c.setFillColor(HexColor("#FFF9C4"))  # amarelo clarinho
+        c.rect(margin, box_y, box_width, total_height, fill=1, stroke=0)
 
-    # Desenha os parágrafos dentro da caixa
-    quote_para.drawOn(c, margin + padding, box_y + caption_height + padding)
-    if caption_para:
-        caption_para.drawOn(c, margin + padding, box_y + padding)
+        # Desenha os parágrafos dentro da caixa
+        quote_para.drawOn(c, margin + padding, box_y + caption_height + padding)
+        if caption_para:
+            caption_para.drawOn(c, margin + padding, box_y + padding)
 
-    return box_y - 0.3 * cm  # espaçamento abaixo do bloco
+    return [Fragment(need=total_height, advance=total_height + 0.3 * cm, draw=draw)]  # espaçamento abaixo do bloco
 
-# Função para renderizar os Warnings
-def render_warning(c, block_data, current_y, page_width, page_height, margin):
+# Função para medir os Warnings
+def measure_warning(block_data, page_width, page_height, margin):
     title = block_data.get("title", "")
     message = block_data.get("message", "")
-    warning_text = f"<b>{title}:</b> {message}"
+    warning_text = sanitize_html(f"<b>{title}:</b> {message}")
 
-    stylesheet = getSampleStyleSheet()
-    style = ParagraphStyle(
-        'WarningStyle',
-        parent=stylesheet['BodyText'],
-        fontName='Helvetica',
-        fontSize=13,
-        leading=18,
-        alignment=TA_LEFT,
-        textColor=colors.black,
-    )
+    style = get_style('warning')
 
     padding = 6
     icon_padding = 6
@@ -316,213 +948,437 @@ def render_warning(c, block_data, current_y, page_width, page_height, margin):
     max_text_width = box_width - icon_size - 3 * padding
 
     # Parágrafo de texto
+    from reportlab.platypus import Paragraph
+
     text = Paragraph(warning_text, style)
     text_width, text_height = text.wrap(max_text_width, page_height)
 
     total_height = max(text_height, icon_size) + 2 * padding
 
-    if current_y - total_height < margin:
-        c.showPage()
-        current_y = page_height - margin
-
-    # Caixa amarela de fundo
-    c.setFillColor(colors.HexColor("#FFF2CC"))
-    c.roundRect(margin, current_y - total_height, box_width, total_height, 6, fill=1, stroke=0)
-
-    # Borda
-    c.setStrokeColor(colors.HexColor("#F7D972"))
-    c.roundRect(margin, current_y - total_height, box_width, total_height, 6, fill=0, stroke=1)
-
-    # Desenho do ícone SVG
-    svg_path = resource_path("assets/warning.svg")
-    if os.path.exists(svg_path):
-        drawing = svg2rlg(svg_path)
-
-        # Escala proporcional
-        desired_icon_size = icon_size  # em pontos
-        scale_x = desired_icon_size / drawing.width
-        scale_y = desired_icon_size / drawing.height
-        drawing.scale(scale_x, scale_y)
+    def draw(c, y):
+        # Caixa amarela de fundo
+        c.setFillColor(colors.HexColor("#FFF2CC"))
+        c.roundRect(margin, y - total_height, box_width, total_height, 6, fill=1, stroke=0)
 
-        # Redefine tamanho
-        drawing.width *= scale_x
-        drawing.height *= scale_y
+        # Borda
+        c.setStrokeColor(colors.HexColor("#F7D972"))
+        c.roundRect(margin, y - total_height, box_width, total_height, 6, fill=0, stroke=1)
 
-        # Centraliza verticalmente
+        # Desenho do ícone SVG (alinhado ao topo do texto)
         icon_x = margin + padding
-        icon_y = current_y - padding - (drawing.height + text_height) / 2 + (text_height - drawing.height) / 2
-
-        renderPDF.draw(drawing, c, icon_x, icon_y)
-
-    # Renderiza texto
-    text_x = margin + padding + icon_size + icon_padding
-    text_y = current_y - padding - text_height
-    text.drawOn(c, text_x, text_y)
+        icon_y = y - padding - icon_size
+        draw_svg_icon(c, "assets/warning.svg", icon_x, icon_y, icon_size, icon_size, keep_aspect=False)
+
+        # Renderiza texto
+        text_x = margin + padding + icon_size + icon_padding
+        text_y = y - padding - text_height
+        text.drawOn(c, text_x, text_y)
+
+    return [Fragment(need=total_height, advance=total_height + 0.2 * cm, draw=draw)]
+
+# Realce de sintaxe opcional (usado apenas se o Pygments estiver instalado)
+
+# Cores do realce de sintaxe sobre o fundo escuro do bloco de código
+CODE_TOKEN_COLORS = {
+    'Comment': "#999999",
+    'Keyword': "#cc99cd",
+    'Name.Builtin': "#e2777a",
+    'Name.Function': "#f08d49",
+    'Name.Class': "#f8c555",
+    'Literal.String': "#7ec699",
+    'Literal.Number': "#f08d49",
+    'Operator': "#67cdcc",
+}
+
+# Lexer por linguagem (criado uma única vez por processo)
+# (o Pygments só é importado no primeiro bloco com "language")
+@functools.lru_cache(maxsize=32)
+def get_code_lexer(language):
+    if not language:
+        return None
+    try:
+        from pygments.lexers import get_lexer_by_name
+        from pygments.util import ClassNotFound
+    except ImportError:
+        return None
+    try:
+        return get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def get_token_color(token_type):
+    from pygments.token import Token
+
+    while token_type is not Token:
+        color = CODE_TOKEN_COLORS.get(str(token_type)[len("Token."):])
+        if color:
+            return HexColor(color)
+        token_type = token_type.parent
+    return colors.white
+
+# Largura de um caractere da fonte monoespaçada (em cache)
+@functools.lru_cache(maxsize=None)
+def char_width(font_name, font_size):
+    return stringWidth("M", font_name, font_size)
+
+# Quebra as linhas do código em trechos de (texto, cor) que cabem na largura
+def split_code_lines(code_text, language, max_chars):
+    lexer = get_code_lexer(language)
+    if lexer is None:
+        runs = [(code_text, None)]
+    else:
+        runs = [(value, get_token_color(token_type)) for token_type, value in lexer.get_tokens(code_text)]
+
+    lines = []
+    line = []
+    length = 0
+    for value, color in runs:
+        parts = value.split("\n")
+        for index, part in enumerate(parts):
+            if index:
+                lines.append(line)
+                line = []
+                length = 0
+            # Linhas longas continuam na linha seguinte
+            while length + len(part) > max_chars:
+                cut = max_chars - length
+                line.append((part[:cut], color))
+                lines.append(line)
+                line = []
+                length = 0
+                part = part[cut:]
+            if part:
+                line.append((part, color))
+                length += len(part)
+    lines.append(line)
+    return lines
+
+# Cria o fragmento de um trecho de linhas de código (divisível entre páginas)
+def code_fragment(lines, x, box_width, style, padding, gap):
+    text_height = len(lines) * style.leading
+    total_height = text_height + 2 * padding
 
-    return current_y - total_height - 0.2 * cm
+    def draw(c, y):
+        # Caixa com fundo escuro e borda leve
+        c.setFillColor(colors.HexColor("#2d2d2d"))  # fundo estilo editor
+        c.roundRect(x, y - total_height, box_width, total_height, 4, fill=1, stroke=0)
+
+        # Borda
+        c.setStrokeColor(colors.HexColor("#444444"))
+        c.roundRect(x, y - total_height, box_width, total_height, 4, fill=0, stroke=1)
+
+        # Desenha as linhas direto no canvas, uma por linha de texto
+        c.saveState()
+        text = c.beginText(x + padding, y - padding - style.fontSize)
+        text.setFont(style.fontName, style.fontSize, style.leading)
+        text.setFillColor(style.textColor)
+        current_color = style.textColor
+        current_font = style.fontName
+        for line in lines:
+            for value, color in line:
+                color = color or style.textColor
+                if color != current_color:
+                    text.setFillColor(color)
+                    current_color = color
+                for font_name, part in text_runs(value, style.fontName, mono=True):
+                    if font_name != current_font:
+                        text.setFont(font_name, style.fontSize, style.leading)
+                        current_font = font_name
+                    text.textOut(part)
+            text.textLine()
+        c.drawText(text)
+        c.restoreState()
+
+    def split(avail):
+        count = int((avail - 2 * padding) // style.leading)
+        if count < 1 or count >= len(lines):
+            return None
+        return (code_fragment(lines[:count], x, box_width, style, padding, 0),
+                code_fragment(lines[count:], x, box_width, style, padding, gap))
+
+    return Fragment(need=total_height, advance=total_height + gap, draw=draw, split=split)
+
+# Função para medir blocos de código
+def measure_code_block(block_data, page_width, page_height, margin):
+    """
+    Mede um bloco de código desenhado linha a linha em fonte monoespaçada.
 
-# Função para renderizar blocos de código
-def render_code_block(c, block_data, current_y, page_width, page_height, margin):
+    As linhas não passam pelo Paragraph: são cortadas pela largura fixa dos
+    caracteres e a caixa escura pode ser dividida entre páginas em uma
+    quebra de linha. Com o Pygments instalado e o campo "language"
+    preenchido, o código é colorido.
+    """
     code_text = block_data.get("code", "")
     if not code_text.strip():
-        return current_y
-
-    code_text = html.escape(code_text)  # Escapa <, >, &, etc.
-    code_text = code_text.replace(" ", "&nbsp;").replace("\n", "<br/>")
+        return []
 
     # Estilo da fonte do código
-    style = ParagraphStyle(
-        'CodeStyle',
-        fontName='Courier',  # Monoespaçada
-        fontSize=10.5,
-        leading=14,
-        textColor=colors.white,
-        alignment=TA_LEFT,
-        leftIndent=0,
-        rightIndent=0,
-        spaceAfter=0,
-        spaceBefore=0,
-    )
+    style = get_style('code')
 
     padding = 6
     box_width = page_width - 2 * margin
 
-    # Garante que o texto preserve os espaços e quebras de linha
-    code_text = code_text.replace(" ", "&nbsp;").replace("\n", "<br/>")
-    paragraph = Paragraph(code_text, style)
-    text_width, text_height = paragraph.wrap(box_width - 2 * padding, page_height)
-
-    total_height = text_height + 2 * padding
-
-    if current_y - total_height < margin:
-        c.showPage()
-        current_y = page_height - margin
+    # Tabs viram espaços; a quebra de linha final não gera uma linha vazia
+    code_text = code_text.expandtabs(4)
+    if code_text.endswith("\n"):
+        code_text = code_text[:-1]
 
-    # Caixa com fundo escuro e borda leve
-    c.setFillColor(colors.HexColor("#2d2d2d"))  # fundo estilo editor
-    c.roundRect(margin, current_y - total_height, box_width, total_height, 4, fill=1, stroke=0)
+    max_chars = max(1, int((box_width - 2 * padding) // char_width(style.fontName, style.fontSize)))
+    lines = split_code_lines(code_text, block_data.get("language"), max_chars)
 
-    # Borda
-    c.setStrokeColor(colors.HexColor("#444444"))
-    c.roundRect(margin, current_y - total_height, box_width, total_height, 4, fill=0, stroke=1)
-
-    # Renderiza o bloco de código dentro da caixa
-    paragraph.drawOn(c, margin + padding, current_y - padding - text_height)
-
-    return current_y - total_height - 0.2 * cm
-
-# Função para renderizar delimitadores
-def render_delimiter(c, current_y, page_width, page_height, margin):
-    from reportlab.lib.colors import HexColor
+    return [code_fragment(lines, margin, box_width, style, padding, 0.2 * cm)]
 
+# Função para medir delimitadores
+def measure_delimiter(block_data, page_width, page_height, margin):
     text = "***"
     color = HexColor("#3498db")  # Azul claro
     font_size = 16
 
-    # Verifica se há espaço suficiente
     text_height = font_size * 1.2
-    if current_y - text_height < margin:
-        c.showPage()
-        current_y = page_height - margin
-
-    # Define estilo
-    c.setFont("Helvetica-Bold", font_size)
-    c.setFillColor(color)
-
-    text_width = c.stringWidth(text, "Helvetica-Bold", font_size)
+    text_width = stringWidth(text, "Helvetica-Bold", font_size)
     x_position = (page_width - text_width) / 2
-    y_position = current_y - font_size
 
-    # Desenha o texto no centro da página
-    c.drawString(x_position, y_position, text)
+    def draw(c, y):
+        # Define estilo
+        c.setFont("Helvetica-Bold", font_size)
+        c.setFillColor(color)
 
-    return current_y - text_height - 0.2 * cm
+        # Desenha o texto no centro da página
+        c.drawString(x_position, y - font_size, text)
 
-# Função para renderizar tabelas
-def render_table(c, block_data, current_y, page_width, page_height, margin):
-    content = block_data.get("content", [])
-    if not content:
-        return current_y
+    return [Fragment(need=text_height, advance=text_height + 0.2 * cm, draw=draw)]
 
-    # Define tamanho máximo e mínimo para colunas
-    num_cols = len(content[0])
-    table_width = page_width - 2 * margin
-    col_width = table_width / num_cols
+# Quantidade de linhas medidas por vez e de linhas usadas para estimar as colunas
+TABLE_CHUNK_ROWS = 100
+TABLE_SAMPLE_ROWS = 200
+
+# Estilo da tabela (a linha 0 é o cabeçalho, repetido em cada página)
+def table_style(with_headings):
+    from reportlab.platypus import TableStyle
 
-    # Estilo da tabela
-    style = TableStyle([
+    return TableStyle([
         ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
         ('FONTSIZE', (0, 0), (-1, -1), 12),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#D3D3D3") if block_data.get("withHeadings") else colors.white),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#D3D3D3") if with_headings else colors.white),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
         ('TOPPADDING', (0, 0), (-1, -1), 6),
     ])
 
-    # Criar tabela e calcular altura
-    table = Table(content, colWidths=[col_width]*num_cols)
-    table.setStyle(style)
+# Células com caracteres fora do WinAnsi viram Paragraph (uma célula de texto
+# simples só tem uma fonte); as demais continuam como texto
+def table_cell(cell):
+    if isinstance(cell, str) and _non_winansi.search(cell) and has_unicode_fonts():
+        from reportlab.platypus import Paragraph
+        return Paragraph(sanitize_html(html.escape(cell, quote=False).replace("\n", "<br />")), get_style('table_cell'))
+    return cell
+
+# Larguras das colunas a partir de uma amostra das linhas
+def table_column_widths(content, num_cols, table_width, font_name="Helvetica", font_size=12, padding=12):
+    step = max(1, len(content) // TABLE_SAMPLE_ROWS)
+    natural = [0.0] * num_cols
+    for row in content[::step]:
+        for col, cell in enumerate(row):
+            for line in str(cell).split("\n"):
+                natural[col] = max(natural[col], text_width(line, font_name, font_size) + padding)
+
+    # Distribui a largura total proporcionalmente, com um mínimo por coluna
+    min_width = table_width / num_cols / 3
+    weights = [max(width, min_width) for width in natural]
+    total = sum(weights)
+    return [table_width * weight / total for weight in weights]
+
+# Cria o fragmento de um trecho de linhas da tabela (divisível entre páginas)
+def table_fragment(rows, row_heights, header, header_height, col_widths, style, x, gap):
+    total_height = header_height + sum(row_heights)
+
+    def draw(c, y):
+        from reportlab.platypus import Table
+
+        # A Table do trecho só existe durante o desenho
+        table = Table(([header] if header is not None else []) + rows, colWidths=col_widths)
+        table.setStyle(style)
+        table.wrap(sum(col_widths), total_height)
+        table.drawOn(c, x, y - total_height)
+
+    def split(avail):
+        used = header_height
+        count = 0
+        while count < len(rows) and used + row_heights[count] <= avail:
+            used += row_heights[count]
+            count += 1
+        if count < 1 or count >= len(rows):
+            return None
+        return (table_fragment(rows[:count], row_heights[:count], header, header_height, col_widths, style, x, 0),
+                table_fragment(rows[count:], row_heights[count:], header, header_height, col_widths, style, x, gap))
+
+    return Fragment(need=total_height, advance=total_height + gap, draw=draw, split=split)
+
+# Função para medir tabelas
+def measure_table(block_data, page_width, page_height, margin):
+    """
+    Mede uma tabela em trechos de TABLE_CHUNK_ROWS linhas.
+
+    Apenas a altura de cada linha é guardada; as Tables do reportlab são
+    montadas por trecho e descartadas, então a memória de trabalho não cresce
+    com o número de linhas. Tabelas maiores que uma página são divididas
+    entre páginas, repetindo o cabeçalho quando "withHeadings" está ativo.
+    """
+    content = block_data.get("content", [])
+    if not content:
+        return []
 
-    _, table_height = table.wrapOn(c, table_width, page_height)
+    num_cols = max(len(row) for row in content)
+    if not num_cols:
+        return []
 
-    if current_y - table_height < margin:
-        c.showPage()
-        current_y = page_height - margin
+    # Linhas incompletas recebem células vazias
+    content = [list(row) + [""] * (num_cols - len(row)) for row in content]
 
-    table.drawOn(c, margin, current_y - table_height)
+    table_width = page_width - 2 * margin
+    col_widths = table_column_widths(content, num_cols, table_width)
+    content = [[table_cell(cell) for cell in row] for row in content]
+
+    from reportlab.platypus import Table
+
+    with_headings = bool(block_data.get("withHeadings"))
+    style = table_style(with_headings)
+
+    # Altura de cada linha, medida trecho a trecho
+    row_heights = []
+    for start in range(0, len(content), TABLE_CHUNK_ROWS):
+        chunk = Table(content[start:start + TABLE_CHUNK_ROWS], colWidths=col_widths)
+        chunk.setStyle(style)
+        chunk.wrap(table_width, page_height)
+        row_heights.extend(chunk._rowHeights)
+
+    if with_headings:
+        header, rows = content[0], content[1:]
+        header_height, row_heights = row_heights[0], row_heights[1:]
+        if not rows:
+            rows, row_heights, header, header_height = [header], [header_height], None, 0
+    else:
+        header, rows, header_height = None, content, 0
 
-    return current_y - table_height - 0.5 * cm
+    return [table_fragment(rows, row_heights, header, header_height, col_widths, style, margin, 0.5 * cm)]
 
-# Função para inserir imagens
-def render_image_block(c, data, current_y, page_width, page_height, margin, max_width=6*inch, max_height=6*inch):
-    """
-    Renderiza uma imagem base64 no PDF usando o canvas diretamente.
+# Resolução alvo das imagens no PDF (imagens maiores são reduzidas)
+IMAGE_TARGET_DPI = 200
 
-    Retorna a nova posição Y atualizada após a imagem.
+# Tamanho máximo das imagens na página, em pontos (6 polegadas)
+IMAGE_MAX_SIZE = 6 * 72
 
-    Args:
-        c: canvas do ReportLab.
-        data: dicionário do bloco de imagem (Editor.js).
-        current_y: posição Y atual.
-        page_width: largura da página.
-        page_height: altura da página.
-        margin: margem lateral.
+# Estado da exportação em andamento, por thread (definido por generate_pdf):
+#   asset_root: pasta de onde os blocos de imagem podem ler arquivos locais
+#   cancel: evento que, quando ligado, interrompe a exportação
+_render = threading.local()
+
+_url_scheme = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+# URL da imagem do bloco (o plugin de imagem do Editor.js usa data.file.url)
+def image_url(data):
+    return data.get("url") or (data.get("file") or {}).get("url") or ""
+
+# Resolve um caminho local ou URL file:// dentro da pasta de assets
+def resolve_image_path(url, asset_root=None):
     """
-    base64_string = data.get("url", "")
-    if not base64_string.startswith("data:image/"):
-        return current_y
+    Retorna o caminho absoluto do arquivo de imagem, ou None se a URL não
+    for local (http, https, ...). Caminhos relativos partem da pasta de
+    assets (`asset_root` ou a da exportação em andamento); nenhum caminho
+    pode sair dela (nem por "..", nem por links).
+    """
+    if url.lower().startswith("file:"):
+        from urllib.parse import urlparse, unquote
+        from urllib.request import url2pathname
+
+        parsed = urlparse(url)
+        # file://imagens/a.png: o "host" é na verdade o começo de um caminho relativo
+        path = url2pathname(parsed.path)
+        if parsed.netloc and parsed.netloc != "localhost":
+            path = os.path.join(unquote(parsed.netloc), path.lstrip("/\\"))
+    elif _url_scheme.match(url) and not re.match(r'^[a-zA-Z]:[\\/]', url):
+        return None  # outros esquemas não são lidos (ex.: http)
+    else:
+        path = url
 
-    # Decodifica imagem base64
+    if asset_root is None:
+        asset_root = getattr(_render, "asset_root", None)
+    if asset_root is None:
+        raise ValueError("Local image files need an asset root.")
+
+    root = os.path.realpath(asset_root)
+    path = os.path.realpath(os.path.join(root, path))
     try:
-        img_data = base64.b64decode(base64_string.split(",")[1])
-    except Exception as e:
-        print(f"[Error]: When decoding image: {e}", file=sys.stderr)
-        return current_y
+        inside = os.path.commonpath([root, path]) == root
+    except ValueError:  # discos diferentes no Windows
+        inside = False
+    if not inside:
+        raise ValueError(f"Image path is outside the asset root: {url}")
+    return path
+
+# Abre o conteúdo da imagem: bytes passam direto, arquivos são mapeados em memória
+@contextlib.contextmanager
+def image_buffer(source):
+    """
+    Entrega um buffer com os bytes da imagem sem copiar o arquivo.
 
-    img_io = BytesIO(img_data)
+    Para um caminho, o arquivo é mapeado com mmap (somente leitura) e
+    liberado ao sair do bloco; PIL, hashlib e o leitor de JPEG do
+    reportlab leem direto do mapeamento.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
 
-    try:
-        # Abrir imagem com PIL
-        pil_img = PILImage.open(img_io)
-
-        # Se a imagem tiver canal alpha (transparência), converte para RGB com fundo branco
-        if pil_img.mode in ("RGBA", "LA"):
-            background = PILImage.new("RGB", pil_img.size, (255, 255, 255))  # fundo branco
-            background.paste(pil_img, mask=pil_img.split()[-1])  # aplica alpha como máscara
-            pil_img = background
-        else:
-            pil_img = pil_img.convert("RGB")
-    except Exception as e:
-        print(f"[Error]: When opening image in PIL: {e}", file=sys.stderr)
-        return current_y
+    import mmap
+
+    with open(source, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""  # mmap não aceita arquivos vazios
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+# Arquivo para ler o buffer do início (o mmap já é um; bytes precisam de um BytesIO)
+def buffer_file(buffer):
+    if isinstance(buffer, (bytes, bytearray, memoryview)):
+        return BytesIO(buffer)
+    buffer.seek(0)
+    return buffer
+
+# Imagem já medida, pronta para ser decodificada (load) e desenhada.
+# `memory` estima os bytes dos pixels decodificados (limite da decodificação antecipada).
+PreparedImage = namedtuple('PreparedImage', 'key width_pt height_pt load memory', defaults=(0,))
+
+# Prepara uma imagem codificada (PNG, JPEG, ...) para o PDF
+def prepare_image(source, max_width, max_height, target_dpi=IMAGE_TARGET_DPI):
+    """
+    Lê apenas o cabeçalho da imagem e calcula o tamanho final em pontos.
+
+    `source` são os bytes da imagem ou o caminho de um arquivo; arquivos
+    são lidos por mmap e só ficam abertos durante a medida e o `load()`.
+    Os pixels só são decodificados quando `load()` for chamado (que pode
+    rodar em outra thread, antes do desenho), e apenas se necessário:
+    JPEGs opacos que já estão na resolução alvo são gravados no PDF como
+    estão (DCTDecode), sem decodificar nem recodificar.
+    A chave `key` é o hash do conteúdo, usada para gravar cada imagem
+    uma única vez por documento.
+    """
+    from PIL import Image as PILImage
 
-    img_width_px, img_height_px = pil_img.size
+    with image_buffer(source) as buffer:
+        pil_img = PILImage.open(buffer_file(buffer))
+        img_width_px, img_height_px = pil_img.size
+        dpi = pil_img.info.get("dpi", (96, 96))[0] or 96
+        is_jpeg = pil_img.format == "JPEG"
+        mode = pil_img.mode
+        key = hashlib.sha1(buffer).hexdigest()
 
     # Converter para pontos (assume DPI padrão 96 se não informado)
-    dpi = pil_img.info.get("dpi", (96, 96))[0]
     img_width_pt = img_width_px / dpi * 72
     img_height_pt = img_height_px / dpi * 72
 
@@ -534,103 +1390,1833 @@ def render_image_block(c, data, current_y, page_width, page_height, margin, max_
     img_width_pt *= scale
     img_height_pt *= scale
 
-    # Atualizar Y (com espaço acima)
-    current_y -= img_height_pt + 10  # 10 pts de espaçamento superior
+    # Tamanho em pixels necessário para a resolução alvo no tamanho final
+    target_size = (
+        max(1, min(img_width_px, round(img_width_pt / 72 * target_dpi))),
+        max(1, min(img_height_px, round(img_height_pt / 72 * target_dpi))),
+    )
+    downsample = target_size != (img_width_px, img_height_px)
+
+    passthrough = is_jpeg and mode in ("RGB", "L") and not downsample
+
+    if downsample:
+        key += "_%dx%d" % target_size
+
+    def load():
+        img_obj = pdfdoc.PDFImageXObject(key)
+
+        with image_buffer(source) as buffer:
+            # JPEG opaco: grava os bytes originais
+            if passthrough:
+                img_obj.loadImageFromJPEG(buffer_file(buffer))
+                return img_obj
+
+            img = PILImage.open(buffer_file(buffer))
+            if downsample and is_jpeg:
+                img.draft(img.mode, target_size)  # decodifica o JPEG já reduzido
+            img.load()  # decodifica enquanto o arquivo está mapeado
+        profile_count("image_decoded_bytes", img.width * img.height * len(img.getbands()))
+
+        # Se a imagem tiver canal alpha (transparência), achata sobre fundo branco
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img = img.convert("RGBA")
+            background = PILImage.new("RGB", img.size, (255, 255, 255))  # fundo branco
+            background.paste(img, mask=img.split()[-1])  # aplica alpha como máscara
+            img = background
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        if downsample:
+            img = img.resize(target_size, PILImage.LANCZOS)
+
+        if is_jpeg:
+            # Fotos continuam em JPEG depois de reduzidas
+            jpeg_io = BytesIO()
+            img.save(jpeg_io, format="JPEG", quality=90)
+            jpeg_io.seek(0)
+            img_obj.loadImageFromJPEG(jpeg_io)
+        else:
+            from reportlab.lib.utils import ImageReader
+            img_obj.loadImageFromSRC(ImageReader(img))
+        return img_obj
 
-    # Verificar se ultrapassa a margem inferior
-    if current_y < margin:
-        c.showPage()
-        current_y = page_height - margin - img_height_pt
+    return PreparedImage(key, img_width_pt, img_height_pt, load, img_width_px * img_height_px * 4)
 
-    # Converter imagem RGB para novo BytesIO e desenhar
-    rgb_io = BytesIO()
-    pil_img.save(rgb_io, format="PNG")
-    rgb_io.seek(0)
+# Decodificação antecipada das imagens: enquanto uma página é desenhada, as
+# próximas imagens já são decodificadas e recodificadas em threads (PIL e
+# zlib liberam o GIL nesse trabalho).
+IMAGE_PREFETCH_WINDOW = 4  # imagens em decodificação ou prontas à frente do desenho
+IMAGE_PREFETCH_MEMORY = 256 * 2**20  # limite estimado dos pixels decodificados ao mesmo tempo
 
-    x = (page_width - img_width_pt) / 2  # Centralizado
-    c.drawImage(ImageReader(rgb_io), x, current_y, width=img_width_pt, height=img_height_pt)
+class ImagePrefetcher:
+    """
+    Decodifica as imagens (PreparedImage.load) antes de o desenho chegar nelas.
+
+    As imagens entram na ordem em que são medidas, que é a ordem de desenho.
+    No máximo `window` delas ficam em decodificação ou prontas, somando no
+    máximo `max_memory` bytes estimados (uma imagem sozinha sempre pode
+    começar); as outras esperam a vez. Uma imagem que ainda não começou é
+    decodificada na hora, na thread do desenho.
+    """
+
+    def __init__(self, window=IMAGE_PREFETCH_WINDOW, max_memory=IMAGE_PREFETCH_MEMORY, max_workers=None):
+        self.window = window
+        self.max_memory = max_memory
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = None  # criado só quando a primeira imagem aparece
+        self._waiting = deque()
+        self._started = {}  # chave -> (future, memória estimada)
+        self._seen = set()
+        self._memory = 0
+
+    def add(self, image):
+        """Agenda a decodificação (cada imagem uma vez por PDF)."""
+        if image.key in self._seen:
+            return
+        self._seen.add(image.key)
+        self._waiting.append(image)
+        self._fill()
+
+    def take(self, image):
+        """Retorna o XObject da imagem, esperando a decodificação se preciso."""
+        started = self._started.pop(image.key, None)
+        if started is None:
+            if image in self._waiting:
+                self._waiting.remove(image)
+            return image.load()
+
+        future, memory = started
+        self._memory -= memory
+        try:
+            img_obj = future.result()
+        finally:
+            self._fill()
+        profile_count("images_prefetched")
+        return img_obj
+
+    def close(self):
+        """Descarta o que não foi desenhado e espera as decodificações em andamento."""
+        self._waiting.clear()
+        self._started.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fill(self):
+        while self._waiting and len(self._started) < self.window:
+            image = self._waiting[0]
+            if self._started and self._memory + image.memory > self.max_memory:
+                break
+            self._waiting.popleft()
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="ExportAsPDF-image")
+            self._started[image.key] = (self._executor.submit(image.load), image.memory)
+            self._memory += image.memory
+
+# Liga a decodificação antecipada para a renderização da thread atual
+@contextlib.contextmanager
+def image_prefetch(enabled=True):
+    previous = getattr(_render, "prefetch", None)
+    prefetcher = _render.prefetch = ImagePrefetcher() if enabled else None
+    try:
+        yield prefetcher
+    finally:
+        _render.prefetch = previous
+        if prefetcher is not None:
+            prefetcher.close()
+
+# Decodifica a imagem, ou pega a já decodificada pela decodificação antecipada
+def load_image(image):
+    prefetcher = getattr(_render, "prefetch", None)
+    return prefetcher.take(image) if prefetcher is not None else image.load()
+
+# Desenha uma imagem preparada, gravando o XObject apenas na primeira vez
+def draw_image(c, image, x, y, img_obj=None):
+    doc = c._doc
+    reg_name = doc.getXObjectName(image.key)
+
+    if reg_name not in doc.idToObject:
+        if img_obj is None:
+            img_obj = load_image(image)
+        profile_count("images_embedded")  # só depois de decodificada com sucesso
+        c._setXObjects(img_obj)
+        doc.Reference(img_obj, reg_name)
+        doc.addForm(image.key, img_obj)
+
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.translate(x, y)
+    c.scale(image.width_pt, image.height_pt)
+    c._code.append("/%s Do" % reg_name)
+    c.restoreState()
+    c._formsinuse.append(image.key)
+
+# Rascunho de uma imagem: retângulo cinza do mesmo tamanho, sem decodificar os pixels
+def draw_image_placeholder(c, x, y, width, height):
+    c.saveState()
+    c.setFillColor(HexColor("#EEEEEE"))
+    c.setStrokeColor(HexColor("#BBBBBB"))
+    c.setLineWidth(0.5)
+    c.rect(x, y, width, height, stroke=1, fill=1)
+    c.lines([(x, y, x + width, y + height), (x, y + height, x + width, y)])
+    c.restoreState()
+
+# No modo rascunho só o começo de uma imagem base64 é decodificado: o
+# cabeçalho (com o tamanho) quase sempre está nele; se não estiver, a imagem
+# é decodificada inteira.
+DRAFT_IMAGE_HEADER_CHARS = 64 * 1024
+
+# Função para medir imagens
+def measure_image_block(data, page_width, page_height, margin, max_width=IMAGE_MAX_SIZE, max_height=IMAGE_MAX_SIZE):
+    """
+    Mede uma imagem (base64, caminho local ou URL file://) para o plano de layout.
+
+    Apenas o cabeçalho da imagem é lido aqui; os pixels são decodificados
+    no momento do desenho, e só se a imagem ainda não estiver no PDF.
+    Arquivos locais são lidos da pasta de assets, sem passar por base64.
+    No modo rascunho a imagem vira um retângulo do mesmo tamanho.
 
-    # Descer mais um pouco (margem inferior da imagem)
-    current_y -= 20
+    Args:
+        data: dicionário do bloco de imagem (Editor.js).
+        page_width: largura da página.
+        page_height: altura da página.
+        margin: margem lateral.
+    """
+    draft = getattr(_render, "draft", False)
+    url = image_url(data)
+    header_only = False
+    if url.startswith("data:"):
+        if not url.startswith("data:image/"):
+            return []
+
+        # Decodifica imagem base64
+        try:
+            payload = url.split(",")[1]
+            header_only = draft and len(payload) > DRAFT_IMAGE_HEADER_CHARS
+            source = base64.b64decode(payload[:DRAFT_IMAGE_HEADER_CHARS] if header_only else payload)
+        except Exception as e:
+            print(f"[Error]: When decoding image: {e}", file=sys.stderr)
+            return []
+    else:
+        if not url:
+            return []
+        try:
+            source = resolve_image_path(url)
+        except ValueError as e:
+            print(f"[Error]: {e}", file=sys.stderr)
+            return []
+        if source is None:
+            return []
+
+    try:
+        try:
+            image = prepare_image(source, max_width, max_height)
+        except Exception:
+            if not header_only:
+                raise
+            image = prepare_image(base64.b64decode(payload), max_width, max_height)
+    except Exception as e:
+        print(f"[Error]: When opening image in PIL: {e}", file=sys.stderr)
+        return []
+
+    # Começa a decodificar em segundo plano (o desenho vem depois)
+    prefetcher = getattr(_render, "prefetch", None)
+    if prefetcher is not None and not draft:
+        prefetcher.add(image)
+
+    img_width_pt = image.width_pt
+    img_height_pt = image.height_pt
+    x = (page_width - img_width_pt) / 2  # Centralizado
 
-    # Caption (legenda) se houver
     caption = data.get("caption", "")
-    if caption:
-        c.setFont("Helvetica-Oblique", 9)
-        c.setFillColor(gray)
-        caption_width = stringWidth(caption, "Helvetica-Oblique", 9)
-        caption_x = (page_width - caption_width) / 2
-        c.drawString(caption_x, current_y, caption)
-        current_y -= 20  # espaço depois da legenda
-        c.setFillColorRGB(0, 0, 0)  # reset cor para preto
+    caption_runs = text_runs(caption, "Helvetica-Oblique")
+
+    def draw(c, y):
+        image_y = y - img_height_pt
+        try:
+            if draft:
+                draw_image_placeholder(c, x, image_y, img_width_pt, img_height_pt)
+            else:
+                draw_image(c, image, x, image_y)
+        except Exception as e:
+            print(f"[Error]: When opening image in PIL: {e}", file=sys.stderr)
+
+        # Caption (legenda) se houver
+        if caption:
+            c.setFillColor(gray)
+            caption_x = (page_width - runs_width(caption_runs, 9)) / 2
+            draw_text_runs(c, caption_x, image_y - 20, caption_runs, 9)
+            c.setFillColorRGB(0, 0, 0)  # reset cor para preto
+
+    # 10 pts de espaçamento superior, 20 abaixo da imagem e 20 depois da legenda
+    advance = img_height_pt + 20 + (20 if caption else 0)
+    return [Fragment(need=img_height_pt, advance=advance, draw=draw, space_before=10)]
+
+# Funções de medida por tipo de bloco
+MEASURERS = {
+    'header': measure_header,
+    'paragraph': measure_paragraph,
+    'list': measure_list,
+    'checklist': measure_checklist,
+    'quote': measure_quote,
+    'warning': measure_warning,
+    'code': measure_code_block,
+    'delimiter': measure_delimiter,
+    'table': measure_table,
+    'image': measure_image_block,
+}
+
+# Perfil da exportação (--profile). Fica desligado (None) por padrão; ligado,
+# guarda o tempo de cada bloco e das fases, contadores e os eventos do hook.
+_profile = None
+
+PROFILE_PHASES = ("sanitize", "measure", "draw", "save")
+
+def start_profile(hook=None):
+    """
+    Liga o perfil para as próximas exportações deste processo.
 
-    return current_y
+    `hook`, se informado, recebe cada evento (um dict) assim que ele
+    acontece: "block" depois de medir um bloco, "page" depois de desenhar
+    uma página e "report" com o relatório final.
+    """
+    global _profile
+    _profile = {
+        "hook": hook,
+        "started": time.perf_counter(),
+        "phases": dict.fromkeys(PROFILE_PHASES, 0.0),
+        "counters": {
+            "pages": 0,
+            "show_page_calls": 0,
+            "svg_parses": 0,
+            "images_embedded": 0,
+            "images_prefetched": 0,
+            "image_decoded_bytes": 0,
+            "bytes_written": 0,
+            "pdf_cache_hits": 0,
+            "pdf_cache_misses": 0,
+            "wrap_cache_hits": 0,
+            "wrap_cache_misses": 0,
+        },
+        "blocks": [],
+        "current": None,  # bloco sendo medido (recebe o tempo de sanitize)
+    }
+
+# Desliga o perfil e retorna o relatório
+def stop_profile():
+    global _profile
+    profile, _profile = _profile, None
+    if profile is None:
+        return None
+
+    # Tempos em milissegundos, com precisão de microssegundos
+    block_types = {}
+    for record in profile["blocks"]:
+        totals = block_types.setdefault(record["type"], {"count": 0, "sanitize_ms": 0.0, "measure_ms": 0.0, "draw_ms": 0.0})
+        totals["count"] += 1
+        for field in ("sanitize_ms", "measure_ms", "draw_ms"):
+            record[field] = round(record[field], 3)
+            totals[field] += record[field]
+    for totals in block_types.values():
+        for field in ("sanitize_ms", "measure_ms", "draw_ms"):
+            totals[field] = round(totals[field], 3)
+
+    report = {
+        "total_ms": round((time.perf_counter() - profile["started"]) * 1000, 3),
+        "phases_ms": {phase: round(seconds * 1000, 3) for phase, seconds in profile["phases"].items()},
+        "counters": profile["counters"],
+        "peak_rss_kb": peak_rss_kb(),
+        "block_types": block_types,
+        "blocks": profile["blocks"],
+    }
+    if profile["hook"]:
+        profile["hook"](dict(report, event="report"))
+    return report
+
+# Pico de memória do processo em KB (None se o sistema não informar)
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS informa em bytes
+
+def profile_count(name, amount=1):
+    if _profile is not None:
+        _profile["counters"][name] += amount
+
+def profile_event(event, **fields):
+    if _profile is not None and _profile["hook"]:
+        _profile["hook"](dict(fields, event=event))
+
+# Envolve o fragmento para somar o tempo de desenho (e o dos pedaços divididos) ao bloco
+def profiled_fragment(fragment, record):
+    def draw(c, y):
+        start = time.perf_counter()
+        fragment.draw(c, y)
+        elapsed = time.perf_counter() - start
+        record["draw_ms"] += elapsed * 1000
+        if _profile is not None:
+            _profile["phases"]["draw"] += elapsed
+
+    def split(avail):
+        parts = fragment.split(avail)
+        return parts and tuple(profiled_fragment(part, record) for part in parts)
+
+    return fragment._replace(draw=draw, split=split if fragment.split is not None else None)
+
+# Cache de layout por bloco (id do Editor.js + hash do conteúdo), com descarte LRU.
+# Fica desligado por padrão e é ligado pelo modo servidor, onde o mesmo
+# documento costuma ser exportado várias vezes com pequenas edições.
+# Só a medida é reaproveitada; as páginas são desenhadas e gravadas de novo.
+# Além do número de entradas, o cache tem um limite de bytes: os fragmentos
+# de uma imagem base64 guardam os bytes dela. O tamanho de cada entrada é
+# estimado pelo tamanho do bloco em JSON.
+LAYOUT_CACHE_SIZE = 5000
+LAYOUT_CACHE_BYTES = 64 * 2**20
+_layout_cache = None
+_layout_cache_size = LAYOUT_CACHE_SIZE
+_layout_cache_max_bytes = LAYOUT_CACHE_BYTES
+_layout_cache_bytes = 0
+_layout_cache_stats = {"hits": 0, "misses": 0}
+
+def enable_layout_cache(max_entries=LAYOUT_CACHE_SIZE, max_bytes=LAYOUT_CACHE_BYTES):
+    global _layout_cache, _layout_cache_size, _layout_cache_max_bytes
+    if _layout_cache is None:
+        _layout_cache = OrderedDict()
+    _layout_cache_size = max_entries
+    _layout_cache_max_bytes = max_bytes
+    evict_layout_cache()
+
+def layout_cache_stats():
+    return dict(_layout_cache_stats, entries=len(_layout_cache or ()), bytes=_layout_cache_bytes)
+
+# Chave do bloco no cache de layout e o tamanho estimado da entrada; (None, 0) se ele não entra no cache
+def layout_cache_entry(block, page_width, page_height, margin):
+    block_id = block.get('id')
+    if _layout_cache is None or not block_id:
+        return None, 0
+    # Imagens de arquivos podem mudar sem o bloco mudar: não entram no cache
+    if block.get('type') == 'image' and not image_url(block.get('data', {})).startswith("data:"):
+        return None, 0
+    content = json.dumps(block, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    if len(content) > _layout_cache_max_bytes:
+        return None, 0
+    draft = getattr(_render, "draft", False)  # rascunhos medem imagens só pelo cabeçalho
+    return (block_id, hashlib.sha1(content).hexdigest(), page_width, page_height, margin, draft), len(content)
+
+# Descarta as entradas menos usadas até caber nos limites
+def evict_layout_cache():
+    global _layout_cache_bytes
+    while _layout_cache and (len(_layout_cache) > _layout_cache_size or
+                             _layout_cache_bytes > _layout_cache_max_bytes):
+        _, (_, size) = _layout_cache.popitem(last=False)
+        _layout_cache_bytes -= size
+
+# Primeira fase: mede cada bloco e gera seus fragmentos
+def measure_blocks(blocks, page_width, page_height, margin):
+    global _layout_cache_bytes
+    for index, block in enumerate(blocks):
+        check_cancelled()
+        measure = MEASURERS.get(block.get('type'))
+        if measure is None:
+            continue
+
+        record = None
+        if _profile is not None:
+            record = {"index": index, "id": block.get('id'), "type": block.get('type'), "cached": False,
+                      "fragments": 0, "sanitize_ms": 0.0, "measure_ms": 0.0, "draw_ms": 0.0}
+            _profile["current"] = record
+            start = time.perf_counter()
+
+        # Blocos sem alteração desde a última exportação não são medidos de novo
+        key, size = layout_cache_entry(block, page_width, page_height, margin)
+        entry = _layout_cache.get(key) if key else None
+
+        if entry is not None:
+            _layout_cache.move_to_end(key)
+            _layout_cache_stats["hits"] += 1
+            fragments = entry[0]
+            cached = True
+        else:
+            fragments = measure(block.get('data', {}), page_width, page_height, margin)
+            cached = False
+            if key:
+                _layout_cache_stats["misses"] += 1
+                _layout_cache[key] = (fragments, size)
+                _layout_cache_bytes += size
+                evict_layout_cache()
+
+        if record is not None:
+            # O tempo de sanitize é contado à parte do tempo de medida
+            elapsed = time.perf_counter() - start
+            _profile["current"] = None
+            _profile["phases"]["measure"] += elapsed - record["sanitize_ms"] / 1000
+            record.update(cached=cached, fragments=len(fragments), measure_ms=elapsed * 1000 - record["sanitize_ms"])
+            _profile["blocks"].append(record)
+            profile_event("block", **{name: value for name, value in record.items() if name != "draw_ms"})
+            fragments = [profiled_fragment(fragment, record) for fragment in fragments]
+
+        yield from fragments
+
+# Distribui os fragmentos nas páginas
+def paginate(fragments, page_height, margin, after_break=False):
+    """
+    Posiciona cada fragmento e gera as páginas prontas, uma por vez.
 
-# Função principal de geração do PDF
-def generate_pdf(data):
-    buffer = BytesIO()
+    Cada página é uma lista de (fragmento, y). Um fragmento que não cabe no
+    espaço restante vai para a próxima página; se ele não cabe nem em uma
+    página inteira e for divisível, a cabeça ocupa o espaço restante e o
+    resto continua na página seguinte. Com `after_break`, a primeira página
+    começa como depois de uma quebra (sem o espaço antes do 1º fragmento).
+    """
+    top = page_height - margin
+    frame_height = page_height - 2 * margin
+
+    page = []
+    current_y = top
+
+    for fragment in fragments:
+        while fragment is not None:
+            space_before = 0 if after_break else fragment.space_before
+            avail = current_y - space_before - margin
+
+            if fragment.need > avail:
+                parts = None
+                if fragment.split is not None and fragment.need > frame_height and avail > 0:
+                    parts = fragment.split(avail)
+
+                if parts:
+                    head, fragment = parts
+                    page.append((head, current_y - space_before))
+
+                # Quebra a página, a não ser que ela ainda esteja vazia
+                if page:
+                    yield page
+                    page = []
+                    current_y = top
+                    after_break = True
+                    continue
+
+            current_y -= space_before
+            page.append((fragment, current_y))
+            current_y -= fragment.advance
+            after_break = False
+            fragment = None
+
+    if page:
+        yield page
+
+# Plano de layout completo: todas as páginas posicionadas antes de desenhar
+def build_layout(blocks, page_width, page_height, margin, after_break=False):
+    return list(paginate(measure_blocks(blocks, page_width, page_height, margin), page_height, margin, after_break))
+
+# Segunda fase: desenha as páginas já posicionadas; retorna quantas foram desenhadas
+def draw_pages(c, pages):
+    drawn = 0
+    for page_number, page in enumerate(pages):
+        check_cancelled()
+        if page_number:
+            c.showPage()
+            profile_count("show_page_calls")
+        for fragment, y in page:
+            fragment.draw(c, y)
+        profile_count("pages")
+        profile_event("page", page=page_number + 1)
+        drawn += 1
+    return drawn
+
+# Título de uma nota no sumário do PDF combinado
+def note_title(document, index):
+    """
+    Usa a chave "title" do documento ou, se não houver, o texto do primeiro
+    cabeçalho (sem tags); no modo streaming os blocos ainda não foram lidos,
+    então o padrão é "Note N".
+    """
+    title = document.get("title")
+    if not title and isinstance(document["blocks"], list):
+        for block in document["blocks"]:
+            if block.get("type") == "header":
+                title = html.unescape(re.sub(r'<[^>]*>', '', block.get("data", {}).get("text", ""))).strip()
+                break
+    return title or f"Note {index + 1}"
+
+# Perfis de saída do PDF
+#   page_compression: comprime o conteúdo das páginas (zlib, feito pelo reportlab)
+#   compress_level: recomprime todos os streams com este nível do zlib (None = mantém)
+#   object_streams: agrupa os objetos pequenos em object streams (PDF 1.5)
+#   linearize: layout linearizado ("fast web view"), a página 1 abre antes do fim do download
+# Recompressão, object streams e linearização são feitas pelo pikepdf (qpdf), opcional.
+OutputProfile = namedtuple('OutputProfile', 'page_compression compress_level object_streams linearize')
+
+OUTPUT_PROFILES = {
+    'default': OutputProfile(True, None, False, False),
+    'fast': OutputProfile(False, None, False, False),  # sem compressão: gera mais rápido, arquivo maior
+    'compact': OutputProfile(True, 9, True, False),
+    'web': OutputProfile(True, 9, True, True),
+}
+
+def get_output_profile(name):
+    if name not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {name}.")
+    return OUTPUT_PROFILES[name]
+
+# Verifica se o perfil precisa reescrever o PDF com o pikepdf (avisa se ele não estiver instalado)
+def needs_postprocess(profile_name, profile):
+    if profile.compress_level is None and not profile.object_streams and not profile.linearize:
+        return False
+
+    import importlib.util
+    if importlib.util.find_spec("pikepdf") is None:
+        print(f'[Error]: Output profile "{profile_name}" needs pikepdf; writing the PDF without it.', file=sys.stderr)
+        return False
+    return True
+
+# Reescreve o PDF gerado pelo reportlab conforme o perfil
+def postprocess_pdf(pdf_data, output, profile):
+    import pikepdf
+
+    with pikepdf.open(BytesIO(pdf_data)) as pdf:
+        save_pikepdf(pdf, output, profile)
+
+# Grava um PDF aberto no pikepdf conforme o perfil
+def save_pikepdf(pdf, output, profile):
+    import pikepdf
+
+    if profile.compress_level is not None:
+        pikepdf.settings.set_flate_compression_level(profile.compress_level)
+
+    pdf.save(
+        output,
+        compress_streams=profile.page_compression,
+        recompress_flate=profile.compress_level is not None,
+        object_stream_mode=(pikepdf.ObjectStreamMode.generate if profile.object_streams
+                            else pikepdf.ObjectStreamMode.preserve),
+        linearize=profile.linearize,
+    )
+
+# Cache em disco de PDFs prontos, endereçado pelo conteúdo
+#   Cada PDF fica em <pasta>/<2 primeiros dígitos>/<hash>.pdf. A chave é o hash
+#   do documento normalizado, do perfil de saída, dos arquivos de imagem locais
+#   (caminho, tamanho e data) e da versão do renderizador. O mtime de cada PDF
+#   marca o último uso (LRU). Gravações são atômicas (arquivo temporário +
+#   rename); contadores e remoção dos menos usados ficam em stats.json, sob um
+#   lock de arquivo, então vários processos podem usar a mesma pasta.
+PDF_CACHE_SIZE = 256 * 1024 * 1024
+_pdf_cache_dir = None
+_pdf_cache_size = PDF_CACHE_SIZE
+_pdf_cache_stats = {"hits": 0, "misses": 0}  # deste processo
+
+# Bibliotecas que mudam o PDF gerado (trocar a versão invalida o cache)
+RENDERER_DEPENDENCIES = ("reportlab", "PIL", "svglib", "pygments", "pikepdf")
+
+def enable_pdf_cache(directory, max_bytes=PDF_CACHE_SIZE):
+    global _pdf_cache_dir, _pdf_cache_size
+    if directory is None:
+        _pdf_cache_dir = None
+        return
+    os.makedirs(directory, exist_ok=True)
+    _pdf_cache_dir = os.path.abspath(directory)
+    _pdf_cache_size = max_bytes
+
+# Identifica o renderizador: este script (ou o executável) e as bibliotecas instaladas
+@functools.lru_cache(maxsize=None)
+def renderer_stamp():
+    import importlib.util
+
+    if getattr(sys, 'frozen', False):
+        stat = os.stat(sys.executable)
+        stamp = [sys.executable, stat.st_size, stat.st_mtime_ns]
+    else:
+        with open(os.path.abspath(__file__), 'rb') as file:
+            stamp = [hashlib.sha1(file.read()).hexdigest()]
+
+    # Sem importar as bibliotecas: o arquivo de cada uma muda quando ela é reinstalada
+    for name in RENDERER_DEPENDENCIES:
+        spec = importlib.util.find_spec(name)
+        origin = spec.origin if spec else None
+        try:
+            stamp.append([name, origin, os.stat(origin).st_mtime_ns])
+        except (OSError, TypeError):
+            stamp.append([name, origin])
+    return stamp
+
+# Estado dos arquivos de imagem locais dos blocos (para a chave do cache)
+def local_image_files(blocks, asset_root):
+    files = []
+    for block in blocks:
+        if block.get('type') != 'image':
+            continue
+        url = image_url(block.get('data', {}))
+        if not url or url.startswith("data:"):
+            continue
+        try:
+            path = resolve_image_path(url, asset_root)
+            stat = os.stat(path) if path else None
+            files.append([url, path, stat.st_size, stat.st_mtime_ns] if stat else [url])
+        except (OSError, ValueError) as e:
+            files.append([url, str(e)])
+    return files
+
+# Chave do cache para um documento (ou lista deles); None se não puder ser calculada
+def pdf_cache_key(data, output_profile, asset_root):
+    documents = data if isinstance(data, list) else [data]
+    asset_roots = asset_root if isinstance(asset_root, list) else [asset_root] * len(documents)
+
+    normalized = []
+    for document, root in zip(documents, asset_roots):
+        blocks = document['blocks']
+        if not isinstance(blocks, list):
+            return None  # modo streaming: os blocos só são lidos ao desenhar
+        # Só o que muda o PDF: "time", "version" e outras chaves são ignoradas
+        normalized.append({"title": document.get("title"), "blocks": blocks,
+                           "files": local_image_files(blocks, root)})
+
+    content = json.dumps([renderer_stamp(), output_profile, isinstance(data, list), normalized],
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def pdf_cache_path(key):
+    return os.path.join(_pdf_cache_dir, key[:2], key + ".pdf")
+
+# Lock exclusivo entre processos (e threads) sobre a pasta do cache
+@contextlib.contextmanager
+def pdf_cache_lock():
+    with open(os.path.join(_pdf_cache_dir, ".lock"), 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+# Atualiza os contadores de stats.json (chamar com o lock); retorna o novo estado
+def update_pdf_cache_stats(**changes):
+    path = os.path.join(_pdf_cache_dir, "stats.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            stats = json.load(file)
+    except (OSError, ValueError):
+        stats = {}
+    for name in ("hits", "misses", "evictions", "bytes"):
+        stats[name] = stats.get(name, 0) + changes.get(name, 0)
+    if not changes:
+        return stats
+
+    temp_path = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(stats, file)
+    os.replace(temp_path, path)
+    return stats
+
+# Lista os PDFs do cache: (último uso, tamanho, caminho)
+def scan_pdf_cache():
+    entries = []
+    for folder in os.scandir(_pdf_cache_dir):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            if entry.name.endswith(".pdf"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removido por outro processo
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+# Remove os PDFs usados há mais tempo até o cache caber no limite (chamar com o lock)
+def evict_pdf_cache():
+    entries = sorted(scan_pdf_cache())
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in entries:
+        if total <= _pdf_cache_size:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue  # em uso (Windows) ou já removido
+        total -= size
+        evicted += 1
+    return total, evicted
+
+# Copia o PDF do cache para a saída; retorna False se ele não estiver no cache
+def pdf_cache_fetch(key, output):
+    import shutil
+
+    path = pdf_cache_path(key)
+    try:
+        file = open(path, 'rb')
+    except OSError:
+        with pdf_cache_lock():
+            update_pdf_cache_stats(misses=1)
+        _pdf_cache_stats["misses"] += 1
+        profile_count("pdf_cache_misses")
+        return False
+
+    with file:
+        try:
+            os.utime(path)  # último uso, para o LRU
+        except OSError:
+            pass
+        shutil.copyfileobj(file, output)
+        profile_count("bytes_written", file.tell())
+    with pdf_cache_lock():
+        update_pdf_cache_stats(hits=1)
+    _pdf_cache_stats["hits"] += 1
+    profile_count("pdf_cache_hits")
+    return True
+
+# Gera o PDF direto em um arquivo do cache e depois o copia para a saída
+def render_into_pdf_cache(key, data, output, output_profile):
+    import shutil
+    import tempfile
+
+    path = pdf_cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+
+    def discard():
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+    try:
+        with os.fdopen(fd, 'w+b') as file:
+            render_pdf(data, file, output_profile)
+            size = file.tell()
+            file.seek(0)
+            shutil.copyfileobj(file, output)
+    except BaseException:
+        discard()
+        raise
+
+    with pdf_cache_lock():
+        # O PDF já foi entregue: se não der para guardá-lo (ex.: arquivo em uso no Windows), segue sem ele
+        try:
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError:
+            discard()
+            return
 
-    c = canvas.Canvas(buffer, pagesize=A4)
+        stats = update_pdf_cache_stats(bytes=size - replaced)
+        if stats["bytes"] > _pdf_cache_size:
+            total, evicted = evict_pdf_cache()
+            update_pdf_cache_stats(evictions=evicted, bytes=total - stats["bytes"])
+
+# Resultado do cache na última exportação: "hit", "miss" ou None (recebe os contadores de antes)
+def pdf_cache_result(before):
+    if _pdf_cache_stats["hits"] > before["hits"]:
+        return "hit"
+    if _pdf_cache_stats["misses"] > before["misses"]:
+        return "miss"
+    return None
+
+# Estatísticas do cache: contadores deste processo e os acumulados na pasta
+def pdf_cache_stats():
+    if _pdf_cache_dir is None:
+        return None
+    entries = scan_pdf_cache()
+    with pdf_cache_lock():
+        stats = update_pdf_cache_stats()
+    return {
+        "directory": _pdf_cache_dir,
+        "max_bytes": _pdf_cache_size,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "evictions": stats["evictions"],
+        "process": dict(_pdf_cache_stats),
+    }
+
+# Função principal de geração do PDF
+def generate_pdf(data, output=None, output_profile='default', asset_root=None, cancel=None, jobs=1,
+                 draft=False, max_pages=None):
+    # O canvas escreve direto no destino (stdout por padrão) ao salvar;
+    # perfis que reescrevem o PDF passam antes por um buffer em memória.
+    # `data` é um documento ou uma lista deles (combinados em um único PDF).
+    # Imagens com caminho local são lidas de `asset_root` (sem ela, só base64);
+    # com vários documentos, pode ser uma lista com uma pasta por documento.
+    # Com `cancel` (um threading.Event) ligado, para no próximo bloco ou página.
+    # Com `jobs` > 1, documentos grandes são desenhados em paralelo por faixas de páginas.
+    # Com `draft`, gera uma prévia rápida: imagens e ícones viram formas simples,
+    # sem compressão, com as mesmas quebras de página; `max_pages` para depois
+    # de N páginas (sem medir o resto do documento).
+    # As imagens são decodificadas em threads, à frente do desenho (menos no rascunho).
+    # Com o cache de PDFs ligado, um documento já exportado é copiado do cache.
+    if output is None:
+        output = sys.stdout.buffer
+
+    state = ("asset_root", "cancel", "jobs", "draft", "max_pages")
+    previous = [getattr(_render, name, None) for name in state]
+    _render.asset_root, _render.cancel, _render.jobs = asset_root, cancel, jobs
+    _render.draft, _render.max_pages = draft, max_pages
+    try:
+        # Prévias não passam pelo cache de PDFs
+        cached = _pdf_cache_dir and not draft and not max_pages
+        key = pdf_cache_key(data, output_profile, asset_root) if cached else None
+        with image_prefetch(enabled=not draft):
+            if key is None:
+                render_pdf(data, output, output_profile)
+            elif not pdf_cache_fetch(key, output):
+                render_into_pdf_cache(key, data, output, output_profile)
+    finally:
+        for name, value in zip(state, previous):
+            setattr(_render, name, value)
+
+# Interrompe a exportação da thread atual se ela foi cancelada
+def check_cancelled():
+    cancel = getattr(_render, "cancel", None)
+    if cancel is not None and cancel.is_set():
+        raise ExportCancelled("Export was cancelled.")
+
+# Mede, pagina, desenha e grava o PDF no destino
+def render_pdf(data, output, output_profile, after_break=False):
+    load_reportlab()
+    draft = getattr(_render, "draft", False)
+    max_pages = getattr(_render, "max_pages", None)
+    sharded = (getattr(_render, "jobs", None) or 1) > 1 and not draft and not max_pages
+    if sharded and render_sharded(data, output, output_profile):
+        return
+
+    # O rascunho é gravado sem compressão (mais rápido de gerar)
+    if draft:
+        output_profile = 'fast'
+    profile = get_output_profile(output_profile)
+    target = BytesIO() if needs_postprocess(output_profile, profile) else output
+
+    c = canvas.Canvas(target, pagesize=A4, pageCompression=int(profile.page_compression))
     page_width, page_height = A4
     margin = 2 * cm
-    current_y = page_height - margin
-
-    for block in data['blocks']:
-        block_type = block.get('type')
-        block_data = block.get('data', {})
-
-        if block_type == 'header':
-            current_y = render_header(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == 'paragraph':
-            current_y = render_paragraph(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == 'list':
-            current_y = render_list(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == 'checklist':
-            current_y = render_checklist(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == "quote":
-            current_y = render_quote(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == "warning":
-            current_y = render_warning(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == "code":
-            current_y = render_code_block(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == "delimiter":
-            current_y = render_delimiter(c, current_y, page_width, page_height, margin)
-        elif block_type == 'table':
-            current_y = render_table(c, block_data, current_y, page_width, page_height, margin)
-        elif block_type == 'image':
-            current_y = render_image_block(c, block_data, current_y, page_width, page_height, margin)
 
+    # Vários documentos vão para o mesmo canvas: fontes, ícones e imagens
+    # repetidas são gravados uma única vez, e cada nota ganha um marcador
+    combined = isinstance(data, list)
+    documents = data if combined else [data]
+    asset_roots = _render.asset_root
+    if not isinstance(asset_roots, list):
+        asset_roots = [asset_roots] * len(documents)
+
+    drawn = total = 0
+    for index, (document, asset_root) in enumerate(zip(documents, asset_roots)):
+        if max_pages and total >= max_pages:
+            break
+        _render.asset_root = asset_root
+
+        # Cada nota começa em uma página nova
+        if drawn:
+            c.showPage()
+            profile_count("show_page_calls")
+        if combined:
+            key = f"note_{index}"
+            c.bookmarkPage(key)
+            c.addOutlineEntry(note_title(document, index), key, level=0)
+
+        # Primeira fase: mede os blocos e monta o plano de páginas.
+        # No modo streaming as páginas são desenhadas assim que ficam prontas.
+        # Com `max_pages`, também: os blocos depois da última página nem são medidos.
+        blocks = document['blocks']
+        if isinstance(blocks, list) and not max_pages:
+            pages = build_layout(blocks, page_width, page_height, margin, after_break)
+        else:
+            pages = paginate(measure_blocks(blocks, page_width, page_height, margin), page_height, margin,
+                             after_break)
+            if max_pages:
+                import itertools
+                pages = itertools.islice(pages, max_pages - total)
+
+        # Segunda fase: desenha a partir do plano
+        count = draw_pages(c, pages)
+        drawn = count or drawn
+        total += count
+
+    if combined:
+        c.showOutline()
+
+    if _profile is None:
+        save_pdf(c, target, output, profile)
+        return
+
+    # Com o perfil ligado, mede a gravação e os bytes escritos
+    try:
+        position = output.tell()
+    except (AttributeError, OSError):
+        position = None
+    start = time.perf_counter()
+    save_pdf(c, target, output, profile)
+    _profile["phases"]["save"] += time.perf_counter() - start
+    if position is None:
+        _profile["counters"]["bytes_written"] = None  # ex.: stdout ligado a um pipe
+    elif _profile["counters"]["bytes_written"] is not None:
+        profile_count("bytes_written", output.tell() - position)
+
+# Grava o PDF do canvas; com um buffer intermediário, reescreve conforme o perfil
+def save_pdf(c, target, output, profile):
+    c.save()
+    if target is not output:
+        postprocess_pdf(target.getbuffer(), output, profile)
+
+# Renderização em paralelo por faixas de blocos (jobs > 1 em uma exportação)
+#   1. O documento é dividido em faixas de blocos seguidos, uma por processo.
+#      Cada processo mede sua faixa uma única vez, pagina como se ela
+#      começasse em uma página nova, desenha as páginas em um PDF à parte e
+#      devolve também os números da paginação (need, advance, space_before).
+#   2. Este processo pagina o documento inteiro com esses números. As páginas
+#      de uma faixa coincidem com as do documento a partir da primeira que
+#      abre com o mesmo bloco; as que faltam nas divisas entre as faixas
+#      (em geral uma ou duas) são medidas e desenhadas aqui.
+#   3. As páginas são unidas com o pikepdf, com uma única cópia de cada fonte,
+#      imagem e ícone iguais.
+# As quebras de página são as mesmas da exportação em um único processo.
+SHARD_MIN_BLOCKS = 200  # blocos por faixa; abaixo disso o pool não compensa
+
+# Pagina a partir das métricas; retorna, por página, o bloco que a abre (None se ela começa no meio de um bloco)
+def page_start_blocks(blocks, metrics, page_width, page_height, margin):
+    frame_height = page_height - 2 * margin
+    measured = {}
+
+    # Fragmentos maiores que uma página são divididos de verdade: só esse bloco é medido aqui
+    def split_measured(block_index, number, avail):
+        if block_index not in measured:
+            measured[block_index] = list(measure_blocks([blocks[block_index]], page_width, page_height, margin))
+        return measured[block_index][number].split(avail)
+
+    block_starts = {}
+    fragments = []
+    for block_index, number, need, advance, space_before, splittable in metrics:
+        split = None
+        if splittable and need > frame_height:
+            split = functools.partial(split_measured, block_index, number)
+        fragment = Fragment(need, advance, None, space_before, split)
+        if number == 0:
+            block_starts[id(fragment)] = block_index
+        fragments.append(fragment)
+
+    return [block_starts.get(id(page[0][0])) for page in paginate(fragments, page_height, margin)]
+
+# Desenha as páginas já posicionadas em um PDF à parte
+def draw_pdf_pages(pages, output_profile):
+    output = BytesIO()
+    c = canvas.Canvas(output, pagesize=A4, pageCompression=int(get_output_profile(output_profile).page_compression))
+    draw_pages(c, pages)
     c.save()
-    buffer.seek(0)  # Volta ao início do buffer
+    return output.getvalue()
 
-    # 2. Envia o conteúdo binário para stdout
-    sys.stdout.buffer.write(buffer.read())
+# No pool: mede, pagina e desenha uma faixa de blocos
+def render_shard(blocks, first_index, after_break, output_profile, asset_root):
+    """
+    Retorna o PDF da faixa, o bloco que abre cada página dela (None se a
+    página começa no meio de um bloco) e as métricas de paginação de cada
+    fragmento: (bloco, número, need, advance, space_before, divisível).
+    """
+    load_reportlab()
+    _render.asset_root = asset_root
+    page_width, page_height = A4
+    margin = 2 * cm
+
+    block_starts = {}
+    fragments = []
+    metrics = []
+    with image_prefetch():
+        for offset, block in enumerate(blocks):
+            for number, fragment in enumerate(measure_blocks([block], page_width, page_height, margin)):
+                if number == 0:
+                    block_starts[id(fragment)] = first_index + offset
+                metrics.append((first_index + offset, number, fragment.need, fragment.advance,
+                                fragment.space_before, fragment.split is not None))
+                fragments.append(fragment)
+
+        pages = list(paginate(fragments, page_height, margin, after_break))
+        pdf = draw_pdf_pages(pages, output_profile)
+    return pdf, [block_starts.get(id(page[0][0])) for page in pages], metrics
+
+# Escolhe, em cada faixa, as páginas iguais às do documento inteiro
+def shard_pages(shards, page_starts):
+    """
+    A partir da primeira página da faixa que abre com o mesmo bloco que uma
+    página do documento, as duas paginações coincidem, menos na última
+    página da faixa (os blocos seguintes ainda podem caber nela). Retorna
+    (PDF, primeira página, fim, página no documento) de cada faixa usada.
+    """
+    opens = {block: page for page, block in enumerate(page_starts) if block is not None}
+    used = []
+    for index, (pdf, starts, _) in enumerate(shards):
+        stop = len(starts) if index == len(shards) - 1 else len(starts) - 1
+        for local, block in enumerate(starts[:stop]):
+            if block in opens:
+                used.append((pdf, local, stop, opens[block]))
+                break
+    return used
+
+# Mede e desenha neste processo as páginas [first, stop) do documento
+def render_page_range(blocks, page_starts, first, stop, output_profile):
+    import itertools
+
+    page_width, page_height = A4
+    margin = 2 * cm
+
+    # Pagina a partir da última página anterior que abre com um bloco inteiro
+    opening = first
+    while page_starts[opening] is None:
+        opening -= 1
+    fragments = measure_blocks(blocks[page_starts[opening]:], page_width, page_height, margin)
+    pages = paginate(fragments, page_height, margin, after_break=opening > 0)
+    return draw_pdf_pages(itertools.islice(pages, first - opening, stop - opening), output_profile)
+
+# Desenha um documento grande em paralelo; retorna False se ele deve ser desenhado em um único processo
+def render_sharded(data, output, output_profile):
+    """
+    Só documentos únicos, já carregados, com pelo menos SHARD_MIN_BLOCKS
+    blocos por faixa são divididos, com no máximo um processo por CPU. Com
+    o perfil ligado (--profile) a exportação continua em um processo, para
+    medir cada bloco.
+    """
+    if isinstance(data, list) or not isinstance(data['blocks'], list) or _profile is not None:
+        return False
+    blocks = data['blocks']
+    jobs = min(_render.jobs, os.cpu_count() or 1, len(blocks) // SHARD_MIN_BLOCKS)
+    if jobs < 2:
+        return False
+
+    import importlib.util
+    if importlib.util.find_spec("pikepdf") is None:
+        print("[Error]: Parallel rendering needs pikepdf; rendering in a single process.", file=sys.stderr)
+        return False
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    profile = get_output_profile(output_profile)
+    shard_profile = 'default' if profile.page_compression else 'fast'  # o resto do perfil vale na união
+    asset_root = _render.asset_root
+    page_width, page_height = A4
+    margin = 2 * cm
+
+    size = -(-len(blocks) // jobs)
+    firsts = range(0, len(blocks), size)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=warm_up) as executor:
+        shards = list(executor.map(render_shard, [blocks[first:first + size] for first in firsts], firsts,
+                                   [first > 0 for first in firsts], [shard_profile] * len(firsts),
+                                   [asset_root] * len(firsts)))
+    check_cancelled()
+
+    metrics = [metric for _, _, part in shards for metric in part]
+    page_starts = page_start_blocks(blocks, metrics, page_width, page_height, margin)
+
+    # Junta as páginas das faixas, na ordem, desenhando aqui as que faltam entre elas
+    parts = []
+    page = 0
+    for pdf, first, stop, start in shard_pages(shards, page_starts) + [(None, 0, 0, len(page_starts))]:
+        if start > page:
+            parts.append((render_page_range(blocks, page_starts, page, start, shard_profile), 0, start - page))
+        if pdf is not None:
+            parts.append((pdf, first, stop))
+        page = start + stop - first
+    check_cancelled()
+
+    merge_pdfs(parts, output, profile)
+    return True
+
+# Une as páginas [primeira, fim) de cada PDF, na ordem, e grava conforme o perfil
+def merge_pdfs(parts, output, profile):
+    import pikepdf
+
+    (first_pdf, first, stop), rest = parts[0], parts[1:]
+    pdf = pikepdf.open(BytesIO(first_pdf))
+    others = [pikepdf.open(BytesIO(part)) for part, _, _ in rest]
+    try:
+        del pdf.pages[stop:]
+        del pdf.pages[:first]
+        for other, (_, first, stop) in zip(others, rest):
+            pdf.pages.extend(other.pages[first:stop])
+        dedupe_resources(pdf)
+        save_pikepdf(pdf, output, profile)
+    finally:
+        for other in others:
+            other.close()
+        pdf.close()
+
+# Chave de conteúdo de um objeto do PDF, seguindo as referências
+def pdf_object_digest(obj, memo):
+    """
+    Objetos com o mesmo conteúdo (inclusive os que eles referenciam) têm a
+    mesma chave, mesmo vindo de PDFs diferentes. /Name é ignorado: o
+    reportlab numera as fontes (F1, F2, ...) na ordem de uso de cada PDF.
+    """
+    import pikepdf
+
+    if not isinstance(obj, pikepdf.Object):  # números e booleanos chegam como tipos do Python
+        return repr(obj).encode()
+    if obj.is_indirect:
+        if obj.objgen in memo:
+            return memo[obj.objgen]
+        memo[obj.objgen] = b"cycle"  # fontes e imagens não têm ciclos, mas por garantia
+
+    digest = hashlib.sha1()
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        entries = obj.stream_dict if isinstance(obj, pikepdf.Stream) else obj
+        for key in sorted(entries.keys()):
+            if key == "/Name":
+                continue
+            if key == "/Resources" and entries.get("/Subtype") == "/Form":
+                digest.update(key.encode() + form_resources_digest(obj, memo))
+            else:
+                digest.update(key.encode() + pdf_object_digest(entries[key], memo))
+        if isinstance(obj, pikepdf.Stream):
+            digest.update(b"stream" + obj.read_raw_bytes())
+    elif isinstance(obj, pikepdf.Array):
+        for item in obj:
+            digest.update(b"[" + pdf_object_digest(item, memo))
+    else:
+        digest.update(repr(obj).encode())
+
+    result = digest.digest()
+    if obj.is_indirect:
+        memo[obj.objgen] = result
+    return result
+
+# Chave dos recursos de um ícone (form XObject), só com os nomes que o desenho usa
+def form_resources_digest(form, memo):
+    """
+    O reportlab aponta os recursos de cada ícone para o dicionário de fontes
+    do PDF inteiro, que muda de uma faixa para outra; só as entradas que o
+    desenho cita (fontes em Tf, imagens em Do) fazem diferença.
+    """
+    import pikepdf
+
+    used = {operand for operands, _ in pikepdf.parse_content_stream(form)
+            for operand in operands if isinstance(operand, pikepdf.Name)}
+    digest = hashlib.sha1()
+    resources = form.Resources
+    for kind in sorted(resources.keys()):
+        entries = resources[kind]
+        if isinstance(entries, pikepdf.Dictionary):
+            for name in sorted(entries.keys()):
+                if name in used:
+                    digest.update(kind.encode() + name.encode() + pdf_object_digest(entries[name], memo))
+        else:
+            digest.update(kind.encode() + pdf_object_digest(entries, memo))
+    return digest.digest()
+
+# Faz as páginas usarem uma única cópia de cada fonte e XObject (imagens e ícones) iguais
+def dedupe_resources(pdf):
+    memo = {}
+    kept = {}
+    for page in pdf.pages:
+        resources = page.obj.get("/Resources")
+        if resources is None:
+            continue
+        for kind in ("/Font", "/XObject"):
+            entries = resources.get(kind)
+            if entries is None:
+                continue
+            for name in list(entries.keys()):
+                ref = entries[name]
+                if not ref.is_indirect:
+                    continue
+                original = kept.setdefault(pdf_object_digest(ref, memo), ref)
+                if original.objgen != ref.objgen:
+                    entries[name] = original
+
+# Gera o PDF no destino escolhido: stdout ("-"), descritor ("fd:N") ou caminho
+def export_pdf(data, target=None, output_profile='default', asset_root=None, **options):
+    """
+    Escreve o PDF direto no destino, sem cópia intermediária.
+
+    Para caminhos de arquivo a escrita é atômica: o PDF é gerado em um
+    arquivo temporário na mesma pasta e renomeado ao final, então o destino
+    nunca fica com um PDF pela metade. As demais opções (jobs, draft,
+    max_pages) vão para generate_pdf.
+    """
+    if target is None or target == "-":
+        generate_pdf(data, sys.stdout.buffer, output_profile, asset_root, **options)
+        return
+
+    if target.startswith("fd:"):
+        with os.fdopen(int(target[3:]), 'wb') as file:
+            generate_pdf(data, file, output_profile, asset_root, **options)
+        return
+
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(target))
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            generate_pdf(data, file, output_profile, asset_root, **options)
+
+        # mkstemp cria o arquivo com permissão 0600; aplica a umask padrão
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+# Processa uma requisição do modo servidor e escreve a resposta
+def handle_request(line, writer):
+    """
+    Atende uma requisição do modo servidor (uma linha JSON).
+
+    Requisição: {"id": ..., "input": "<path_to_JSON_file>", "output": "<path_to_PDF>", "stream": false}
+    Com uma lista de caminhos em "input", as notas são combinadas em um único PDF.
+    Os campos "output", "stream", "output_profile", "asset_root", "draft",
+    "max_pages" e "profile" são opcionais; sem "asset_root", as imagens
+    locais são lidas da pasta do JSON.
+    "output" é sempre um caminho de arquivo ("-" e "fd:N" são recusados);
+    sem ele, o PDF volta na própria resposta. Com "profile": true, o
+    cabeçalho da resposta traz também o relatório do perfil em "profile".
+    Com o cache de PDFs ligado, "cache" diz se o PDF veio dele ("hit" ou "miss").
+
+    Respostas (sempre uma linha JSON de cabeçalho):
+        {"id": ..., "status": "ok", "length": N}  seguido de N bytes do PDF
+        {"id": ..., "status": "ok", "output": "<path_to_PDF>"}
+        {"id": ..., "status": "error", "error": "<mensagem>"}
+    """
+    request_id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object.")
+        request_id = request.get("id")
+
+        json_path = request.get("input")
+        if not json_path:
+            raise ValueError('Request not have "input" key.')
+        # Só caminhos: um número em "input" abriria (e fecharia) um descritor do próprio servidor
+        if not (isinstance(json_path, str) or
+                isinstance(json_path, list) and all(isinstance(path, str) and path for path in json_path)):
+            raise ValueError('"input" must be a file path or a list of file paths.')
+
+        # Uma lista em "input" gera um único PDF com todas as notas
+        json_paths = json_path if isinstance(json_path, list) else [json_path]
+        data, asset_roots = open_documents(json_paths, stream=bool(request.get("stream")))
+        if not isinstance(json_path, list):
+            data, asset_roots = data[0], asset_roots[0]
+        output_profile = request.get("output_profile") or 'default'
+        get_output_profile(output_profile)
+        asset_root = request.get("asset_root") or asset_roots
+        max_pages = request.get("max_pages")
+        if max_pages is not None and (not isinstance(max_pages, int) or max_pages < 1):
+            raise ValueError('"max_pages" must be a positive integer.')
+        options = {"draft": bool(request.get("draft")), "max_pages": max_pages}
+
+        # Só caminhos de arquivo: "-" e "fd:N" escreveriam no próprio canal do servidor
+        output_path = request.get("output")
+        if output_path and (not isinstance(output_path, str) or output_path == "-" or output_path.startswith("fd:")):
+            raise ValueError(f'"output" must be a file path: {output_path}')
+
+        if request.get("profile"):
+            start_profile()
+        cache_before = dict(_pdf_cache_stats)
+        try:
+            if output_path:
+                export_pdf(data, output_path, output_profile, asset_root, **options)
+                header = {"id": request_id, "status": "ok", "output": output_path}
+                payload = b""
+            else:
+                pdf_io = BytesIO()
+                generate_pdf(data, pdf_io, output_profile, asset_root, **options)
+                payload = pdf_io.getbuffer()  # sem copiar o PDF
+                header = {"id": request_id, "status": "ok", "length": len(payload)}
+        finally:
+            report = stop_profile()
+        if report is not None:
+            header["profile"] = report
+        cache_result = pdf_cache_result(cache_before)
+        if cache_result:
+            header["cache"] = cache_result
+    except Exception as e:
+        header = {"id": request_id, "status": "error", "error": str(e)}
+        payload = b""
+
+    writer.write(json.dumps(header).encode('utf-8') + b"\n")
+    writer.write(payload)
+    writer.flush()
+
+# Loop do modo servidor: uma requisição por linha até o fim da entrada
+def serve(reader, writer):
+    enable_layout_cache()
+    load_reportlab()
+    for line in reader:
+        line = line.strip()
+        if not line:
+            continue
+        handle_request(line, writer)
+
+# Modo servidor via Unix socket (uma conexão por vez)
+def serve_socket(socket_path):
+    import socketserver
+
+    if not hasattr(socketserver, "UnixStreamServer"):
+        raise OSError("Unix sockets are not supported on this platform.")
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve(self.rfile, self.wfile)
+
+    # Só remove um socket antigo; qualquer outro arquivo no caminho é um erro
+    if os.path.lexists(socket_path):
+        import stat
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise OSError(f"Not a socket, refusing to replace it: {socket_path}")
+        os.unlink(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+# Carrega estilos e ícones antes da primeira exportação (processos do lote)
+def warm_up():
+    load_reportlab()
+    get_style('paragraph')
+    for icon in ("assets/checked.svg", "assets/unchecked.svg", "assets/warning.svg"):
+        load_svg(icon)
+
+# Inicializa um processo do lote com o mesmo cache de PDFs do processo principal
+def init_batch_worker(cache_dir=None, cache_size=PDF_CACHE_SIZE):
+    enable_pdf_cache(cache_dir, cache_size)
+    warm_up()
+
+# Caminho do PDF de cada JSON do lote
+def batch_outputs(json_paths, output_dir=None):
+    """
+    Sem `output_dir`, o PDF fica ao lado do JSON. Com ela, as subpastas
+    dos JSONs (a partir da pasta comum a todos) são recriadas dentro de
+    `output_dir`, então a/note.json e b/note.json não gravam o mesmo PDF.
+    """
+    if not json_paths:
+        return []
+
+    directories = [os.path.dirname(os.path.abspath(json_path)) for json_path in json_paths]
+    try:
+        base = os.path.commonpath(directories)
+    except ValueError:  # discos diferentes no Windows: só o nome do arquivo
+        base = None
+
+    outputs = []
+    for json_path, directory in zip(json_paths, directories):
+        pdf_name = os.path.splitext(os.path.basename(json_path))[0] + ".pdf"
+        if not output_dir:
+            target_dir = os.path.dirname(json_path)
+        elif base is None:
+            target_dir = output_dir
+        else:
+            target_dir = os.path.normpath(os.path.join(output_dir, os.path.relpath(directory, base)))
+        outputs.append((json_path, os.path.join(target_dir, pdf_name)))
+    return outputs
+
+# Exporta um arquivo do lote; nunca lança exceção, apenas reporta o resultado
+def export_file(json_path, output_path, stream=False, output_profile='default', asset_root=None):
+    try:
+        data = open_document(json_path, stream=stream)
+        cache_before = dict(_pdf_cache_stats)
+        export_pdf(data, output_path, output_profile, asset_root or os.path.dirname(os.path.abspath(json_path)))
+        result = {"input": json_path, "output": output_path, "status": "ok"}
+        cache_result = pdf_cache_result(cache_before)
+        if cache_result:
+            result["cache"] = cache_result
+        return result
+    except Exception as e:
+        return {"input": json_path, "output": output_path, "status": "error", "error": str(e)}
+
+# Lista os JSONs do lote: pasta, padrão glob ou manifesto (um caminho por linha)
+def collect_batch(source):
+    import glob
+
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.json")))
+
+    if glob.has_magic(source):
+        return sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                paths.append(os.path.join(base_dir, line))
+    return paths
+
+# Exporta vários JSONs usando um pool de processos aquecidos
+def run_batch(source, output_dir=None, jobs=None, stream=False, report=None, output_profile='default',
+              asset_root=None):
+    """
+    Exporta todos os JSONs de `source` e escreve uma linha JSON por arquivo
+    em `report` (stdout por padrão), na ordem em que terminam.
+    Sem `asset_root`, as imagens locais de cada JSON são lidas da pasta dele.
+
+    Cada processo do pool carrega o reportlab e os assets uma única vez.
+    Um arquivo com erro não interrompe o lote. Retorna o número de falhas.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if report is None:
+        report = sys.stdout
+
+    jobs = jobs or os.cpu_count() or 1
+    failures = 0
+
+    def emit(result):
+        print(json.dumps(result), file=report, flush=True)
+        return result["status"] != "ok"
+
+    # Dois JSONs não podem gravar o mesmo PDF: o segundo é recusado antes de começar
+    tasks = []
+    targets = set()
+    for json_path, output_path in batch_outputs(collect_batch(source), output_dir):
+        target = os.path.normcase(os.path.abspath(output_path))
+        if target in targets:
+            failures += emit({"input": json_path, "output": output_path, "status": "error",
+                              "error": "Another file in the batch has the same output path."})
+            continue
+        targets.add(target)
+        if output_dir:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        tasks.append((json_path, output_path))
+
+    if jobs == 1 or len(tasks) <= 1:
+        warm_up()
+        for json_path, output_path in tasks:
+            failures += emit(export_file(json_path, output_path, stream, output_profile, asset_root))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=init_batch_worker,
+                             initargs=(_pdf_cache_dir, _pdf_cache_size)) as executor:
+        futures = [executor.submit(export_file, json_path, output_path, stream, output_profile, asset_root)
+                   for json_path, output_path in tasks]
+        for future in as_completed(futures):
+            failures += emit(future.result())
+
+    return failures
+
+# Abre um documento da API: retorna os dados e a pasta de assets padrão (a do JSON)
+def load_document(document, stream=False):
+    if isinstance(document, (str, os.PathLike)):
+        json_path = os.fspath(document)
+        try:
+            data = open_document(json_path, stream=stream)
+        except (OSError, ValueError) as e:
+            raise DocumentError(f"When reading {json_path}: {e}") from e
+        return data, os.path.dirname(os.path.abspath(json_path))
+
+    if not isinstance(document, dict):
+        raise DocumentError("Document must be a JSON object.")
+    try:
+        validate_document(document)
+    except ValueError as e:
+        raise DocumentError(str(e)) from e
+    return document, None
+
+# Exporta um documento como biblioteca (sem stdout e sem sys.exit)
+def export(document, output=None, output_profile='default', asset_root=None, stream=False, cancel=None,
+           jobs=1, draft=False, max_pages=None):
+    """
+    Exporta um documento do Editor.js para PDF.
+
+    `document` é o dicionário já carregado ou o caminho do JSON (neste caso
+    `stream` lê os blocos um por vez e `asset_root` tem como padrão a pasta
+    do JSON). Uma lista de documentos gera um único PDF, com um marcador
+    por nota. Sem `output`, retorna os bytes do PDF; com um objeto de
+    arquivo, escreve nele e retorna None. Com `jobs` > 1, documentos grandes
+    são desenhados em paralelo em até `jobs` processos. `draft` gera uma
+    prévia rápida (imagens e ícones simplificados, mesmas quebras de página)
+    e `max_pages` para depois das N primeiras páginas.
+
+    Lança ValueError para um perfil de saída desconhecido, DocumentError se o
+    documento não puder ser lido, ExportCancelled se `cancel` for ligado e
+    RenderError para as demais falhas.
+    """
+    get_output_profile(output_profile)
+
+    if isinstance(document, list):
+        if not document:
+            raise DocumentError("No documents to export.")
+        opened = [load_document(item, stream) for item in document]
+        data = [item for item, _ in opened]
+        if asset_root is None:
+            asset_root = [root for _, root in opened]
+    else:
+        data, default_root = load_document(document, stream)
+        if asset_root is None:
+            asset_root = default_root
+
+    target = BytesIO() if output is None else output
+    try:
+        generate_pdf(data, target, output_profile, asset_root, cancel, jobs, draft, max_pages)
+    except ExportError:
+        raise
+    except Exception as e:
+        raise RenderError(str(e)) from e
+
+    if output is None:
+        return target.getvalue()
+
+# Exportação para código asyncio, em um executor limitado
+class AsyncExporter:
+    """
+    Roda exportações em segundo plano sem bloquear o event loop.
+
+    No máximo `max_workers` exportações rodam ao mesmo tempo; as outras
+    esperam sua vez (até `max_pending` no total, senão ExportBusy).
+    Cancelar a tarefa (task.cancel(), asyncio.wait_for) interrompe a
+    exportação no próximo bloco ou página, e a vaga só é liberada quando
+    ela de fato parar.
+
+    Com `processes=True` as exportações usam um pool de processos aquecidos
+    (paralelismo real, sem o GIL): o documento é copiado para o processo,
+    o PDF volta em bytes, e uma exportação já iniciada não é interrompida,
+    apenas descartada.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, processes=False):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.processes = processes
+        if processes:
+            self._executor = ProcessPoolExecutor(self.max_workers, initializer=warm_up)
+        else:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="ExportAsPDF")
+        self._slots = None
+        self._pending = 0
+
+    async def export(self, document, output=None, output_profile='default', asset_root=None, stream=False,
+                     draft=False, max_pages=None):
+        """Igual a export(), mas aguardável. Retorna os bytes do PDF se `output` for None."""
+        import asyncio
+
+        if self.max_pending is not None and self._pending >= self.max_pending:
+            raise ExportBusy(f"Too many pending exports ({self._pending}).")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)  # criado já dentro do event loop
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            async with self._slots:
+                if self.processes:
+                    pdf = await loop.run_in_executor(self._executor, functools.partial(
+                        export, document, None, output_profile, asset_root, stream,
+                        draft=draft, max_pages=max_pages))
+                    if output is None:
+                        return pdf
+                    output.write(pdf)
+                    return None
+
+                cancel = threading.Event()
+                future = loop.run_in_executor(self._executor, functools.partial(
+                    export, document, output, output_profile, asset_root, stream, cancel,
+                    draft=draft, max_pages=max_pages))
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # Pede para a thread parar e espera, para não passar do limite
+                    cancel.set()
+                    await asyncio.wait([future])
+                    if not future.cancelled():
+                        future.exception()  # ExportCancelled esperado, já tratado
+                    raise
+        finally:
+            self._pending -= 1
+
+    def close(self, wait=True):
+        """Encerra o executor; com `wait`, espera as exportações em andamento."""
+        self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+# Lê os argumentos da linha de comando
+def parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="ExportAsPDF")
+    parser.add_argument("json_path", nargs="*",
+                        help="path to the Editor.js JSON file; several paths are combined into one PDF "
+                             "with one bookmark per note")
+    parser.add_argument("-o", "--output", metavar="TARGET",
+                        help="write the PDF to a file path (atomically) or to a file descriptor as fd:N "
+                             "instead of stdout")
+    parser.add_argument("--server", action="store_true",
+                        help="keep running and read newline-delimited requests from stdin")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="keep running and read requests from a Unix socket at PATH")
+    parser.add_argument("--stream", action="store_true",
+                        help="read and render the blocks one at a time instead of loading the whole JSON")
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="export every JSON in a directory, glob pattern or manifest file (one path per line)")
+    parser.add_argument("--output-dir", metavar="DIR",
+                        help="directory for the PDFs of --batch (default: next to each JSON)")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help="number of worker processes for --batch (default: number of CPUs); for a single "
+                             "large document, render block ranges in up to N processes (at most one per CPU) and "
+                             "merge them (needs pikepdf)")
+    parser.add_argument("--output-profile", choices=sorted(OUTPUT_PROFILES), default="default",
+                        help="PDF output profile: default, fast (no compression), compact (recompressed, "
+                             "object streams) or web (compact + linearized); compact and web need pikepdf")
+    parser.add_argument("--asset-root", metavar="DIR",
+                        help="directory that image blocks may read local files and file:// URLs from "
+                             "(default: the directory of each JSON file)")
+    parser.add_argument("--draft", action="store_true",
+                        help="fast preview: placeholder images, simple icons and no compression, "
+                             "with the same page breaks as the final export")
+    parser.add_argument("--max-pages", type=int, metavar="N",
+                        help="render only the first N pages (the rest of the document is not measured)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse the PDFs of documents exported before, kept in DIR "
+                             "(safe to share between processes)")
+    parser.add_argument("--cache-size", type=float, default=PDF_CACHE_SIZE / 2**20, metavar="MB",
+                        help="size limit of the --cache directory; the least recently used PDFs are "
+                             "removed first (default: %(default)g)")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="print the --cache statistics (entries, size, hits, misses, evictions) "
+                             "as JSON and exit")
+    parser.add_argument("--profile", nargs="?", const="stderr", metavar="PATH",
+                        help="write a JSON profiling report to stderr, or to PATH if given")
+    parser.add_argument("--profile-live", action="store_true",
+                        help="with --profile, write each profiling event as a JSON line as it happens")
+    return parser.parse_args(argv)
+
+# Liga o perfil da linha de comando; retorna a função que grava o relatório
+def start_cli_profile(destination, live=False):
+    if destination == "stderr":
+        file = sys.stderr
+    else:
+        file = open(destination, 'w', encoding='utf-8')
+
+    def write_event(event):
+        file.write(json.dumps(event) + "\n")
+        file.flush()
+
+    start_profile(hook=write_event if live else None)
+
+    def finish():
+        report = stop_profile()
+        if not live:
+            file.write(json.dumps(report, indent=None if file is sys.stderr else 2) + "\n")
+        if file is not sys.stderr:
+            file.close()
+
+    return finish
 
 # Main Program Execution
 def main():
-    # Verifica se o tamanho dos argumentos 
-    if len(sys.argv) < 2:
-        print("[Error]: Usage: ExportAsPDF <path_to_JSON_file>", file=sys.stderr)
-        sys.exit(1)
+    args = parse_args(sys.argv[1:])
 
-    json_path = sys.argv[1]
+    if args.profile and (args.server or args.socket or args.batch):
+        print('[Error]: --profile is only supported for a single export (use "profile" in server requests).',
+              file=sys.stderr)
+        sys.exit(1)
 
-    try:
-        # Chama a função load_json e armazena na variável data
-        data = load_json(json_path)
+    if args.max_pages is not None and args.max_pages < 1:
+        print("[Error]: --max-pages must be at least 1.", file=sys.stderr)
+        sys.exit(1)
 
-        # Checa se o JSON não está vazio
-        if not data:
-            print("[Error]: JSON file is empty.", file=sys.stderr)
+    # Cache de PDFs prontos (vale também para o servidor e os processos do lote)
+    if args.cache:
+        try:
+            enable_pdf_cache(args.cache, int(args.cache_size * 2**20))
+        except OSError as e:
+            print(f"[Error]: When opening cache directory: {e}", file=sys.stderr)
             sys.exit(1)
 
-        # Checa se existe a chave "blocks" dentro do JSON e ela não está vazia
-        if "blocks" not in data or not data["blocks"]:
-            print('[Error]: JSON file not have "blocks" key.', file=sys.stderr)
+    if args.cache_stats:
+        if not args.cache:
+            print("[Error]: --cache-stats needs --cache.", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(pdf_cache_stats(), indent=2))
+        return
+
+    # Modo servidor: mantém o processo (e os imports) aquecido entre exportações
+    if args.server or args.socket:
+        try:
+            if args.socket:
+                serve_socket(args.socket)
+            else:
+                serve(sys.stdin.buffer, sys.stdout.buffer)
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            print(f"[Error]: When starting server: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    # Modo lote: vários JSONs exportados em paralelo
+    if args.batch:
+        try:
+            failures = run_batch(args.batch, args.output_dir, args.jobs, args.stream,
+                                 output_profile=args.output_profile, asset_root=args.asset_root)
+        except Exception as e:
+            print(f"[Error]: When processing batch: {e}", file=sys.stderr)
+            sys.exit(1)
+        if failures:
             sys.exit(1)
+        return
 
-        # Gera o PDF
-        generate_pdf(data)
+    # Verifica se o tamanho dos argumentos 
+    if not args.json_path:
+        print("[Error]: Usage: ExportAsPDF <path_to_JSON_file>", file=sys.stderr)
+        sys.exit(1)
+
+    json_path = args.json_path[0]
+
+    try:
+        if len(args.json_path) > 1:
+            # Várias notas em um único PDF (cada uma lê as imagens da sua pasta)
+            data, asset_roots = open_documents(args.json_path, stream=args.stream)
+        elif args.stream:
+            # Os blocos são lidos do arquivo conforme são desenhados
+            data = open_document(json_path, stream=True)
+        else:
+            # Chama a função load_json e armazena na variável data
+            data = load_json(json_path)
+
+            # Checa se o JSON está vazio ou sem a chave "blocks"
+            try:
+                validate_document(data)
+            except ValueError as e:
+                print(f"[Error]: {e}", file=sys.stderr)
+                sys.exit(1)
+
+        # Gera o PDF (com o perfil, o relatório é gravado mesmo se a exportação falhar)
+        finish_profile = start_cli_profile(args.profile, args.profile_live) if args.profile else None
+        try:
+            if len(args.json_path) > 1:
+                asset_root = args.asset_root or asset_roots
+            else:
+                asset_root = args.asset_root or os.path.dirname(os.path.abspath(json_path))
+            export_pdf(data, args.output, args.output_profile, asset_root, jobs=args.jobs or 1,
+                       draft=args.draft, max_pages=args.max_pages)
+        finally:
+            if finish_profile:
+                finish_profile()
 
     except Exception as e:
         print(f"[Error]: When processing JSON file: {e}", file=sys.stderr)
@@ -638,4 +3224,9 @@ def main():
 
 # Execution Main
 if __name__ == "__main__":
+    # Necessário para o pool de processos do modo lote no executável do PyInstaller
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+
     main()
\ No newline at end of file
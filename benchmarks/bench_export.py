@@ -0,0 +1,186 @@
+# Benchmark da exportação completa (generate_pdf) com documentos sintéticos
+#
+# Uso: python benchmarks/bench_export.py [--blocks 100] [--repeat 3]
+#          [--only paragraph,table] [--save results.json]
+#          [--baseline baseline.json] [--tolerance 0.15]
+#
+# Cada cenário (um por tipo de bloco, mais um documento misto) roda em um
+# processo separado, para que o pico de memória (RSS) seja só dele.
+# Mede o tempo do generate_pdf, tempo por bloco, páginas por segundo,
+# tamanho do PDF e pico de RSS. Com --baseline, compara os resultados e
+# termina com código 1 se algum cenário piorou além da tolerância.
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import DEFAULT_MIX, generate_document, parse_size  # noqa: E402
+
+# Métricas comparadas com a baseline (maior é pior)
+COMPARED_METRICS = ("seconds", "peak_rss_kb", "bytes")
+
+_page_object = re.compile(rb"/Type /Page\b")
+
+# Pico de memória do processo atual em KB (None se o sistema não informar)
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS informa em bytes
+
+# Executado no processo filho: exporta o documento `repeat` vezes
+def run_one(json_path, repeat):
+    import ExportAsPDF
+
+    with open(json_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    best = None
+    for _ in range(repeat):
+        output = BytesIO()
+        start = time.perf_counter()
+        ExportAsPDF.generate_pdf(data, output)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    pdf = output.getvalue()
+    return {
+        "blocks": len(data["blocks"]),
+        "seconds": best,
+        "pages": len(_page_object.findall(pdf)),
+        "bytes": len(pdf),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+# Gera o documento do cenário e o mede em um processo separado
+def run_scenario(name, mix, args, workdir):
+    document = generate_document(args.blocks, mix, args.image_size, args.image_format,
+                                 args.table_size, args.code_lines, args.seed)
+    json_path = os.path.join(workdir, f"{name}.json")
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(document, file, ensure_ascii=False)
+
+    # O diretório do projeto é o cwd, para os ícones em assets/ serem encontrados
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-one", json_path, "--repeat", str(args.repeat)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr}")
+
+    result = json.loads(completed.stdout)
+    result["ms_per_block"] = result["seconds"] * 1000 / max(1, result["blocks"])
+    result["pages_per_second"] = result["pages"] / result["seconds"] if result["seconds"] else None
+    return result
+
+def print_table(results):
+    print(f"{'scenario':<12}{'blocks':>8}{'seconds':>10}{'ms/block':>10}{'pages':>8}{'pages/s':>10}{'size KB':>10}{'RSS MB':>9}")
+    for name, result in results.items():
+        rss = result["peak_rss_kb"]
+        print(f"{name:<12}{result['blocks']:>8}{result['seconds']:>10.3f}{result['ms_per_block']:>10.2f}"
+              f"{result['pages']:>8}{result['pages_per_second'] or 0:>10.1f}{result['bytes'] / 1024:>10.1f}"
+              f"{(rss / 1024 if rss else 0):>9.1f}")
+
+# Compara com a baseline e retorna a lista de regressões encontradas
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            marker = "REGRESSION" if ratio > 1 + tolerance else ""
+            print(f"{name:<12}{metric:<14}{old:>14.3f} -> {new:<14.3f}{ratio:>7.2f}x {marker}")
+            if marker:
+                regressions.append((name, metric, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_pdf with synthetic documents.")
+    parser.add_argument("--blocks", type=int, default=100, help="Blocks per scenario.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario (the fastest is kept).")
+    parser.add_argument("--only", help="Comma-separated scenarios to run (block types or 'mixed').")
+    parser.add_argument("--image-size", type=parse_size, default=(800, 600))
+    parser.add_argument("--image-format", default="jpeg")
+    parser.add_argument("--table-size", type=parse_size, default=(20, 4))
+    parser.add_argument("--code-lines", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against results saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed slowdown/growth before a regression is reported (0.15 = 15%%).")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.repeat)))
+        return 0
+
+    scenarios = {kind: {kind: 1} for kind in DEFAULT_MIX}
+    scenarios["mixed"] = DEFAULT_MIX
+    if args.only:
+        wanted = [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in wanted if name not in scenarios]
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+        scenarios = {name: scenarios[name] for name in wanted}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, mix in scenarios.items():
+            results[name] = run_scenario(name, mix, args, workdir)
+            print(f"{name}: {results[name]['seconds']:.3f}s", file=sys.stderr)
+
+    print_table(results)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "blocks": args.blocks,
+            "repeat": args.repeat,
+            "image_size": list(args.image_size),
+            "image_format": args.image_format,
+            "table_size": list(args.table_size),
+            "code_lines": args.code_lines,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("options") != report["options"]:
+            print("[Error]: Baseline was recorded with different options; results may not be comparable.",
+                  file=sys.stderr)
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.tolerance:.0%}.", file=sys.stderr)
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# Benchmark do PDF combinado (várias notas em um único PDF)
+#
+# Uso: python benchmarks/bench_notebook.py [--notes 20] [--blocks 60]
+#          [--shared-images 2] [--repeat 3]
+#
+# Compara exportar cada nota separadamente (somando tempos e tamanhos, como
+# ao concatenar os PDFs depois) com exportar todas no mesmo canvas, em que
+# fontes, ícones SVG e imagens repetidas são gravados uma única vez.
+# --shared-images coloca as mesmas imagens (ex.: um logotipo) em todas as notas.
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import ExportAsPDF  # noqa: E402
+from synthetic import generate_document  # noqa: E402
+
+# Gera as notas, todas começando com as mesmas `shared_images` imagens
+def generate_notebook(notes, blocks, shared_images):
+    shared = generate_document(shared_images, {"image": 1}, seed=notes)["blocks"]
+    documents = [generate_document(blocks, seed=seed) for seed in range(notes)]
+    for document in documents:
+        document["blocks"][:0] = shared
+    return documents
+
+# Exporta `data` `repeat` vezes; retorna o menor tempo e o tamanho do PDF
+def measure(data, repeat):
+    best = None
+    for _ in range(repeat):
+        output = BytesIO()
+        start = time.perf_counter()
+        ExportAsPDF.generate_pdf(data, output)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(output.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one combined PDF with separate PDFs per note.")
+    parser.add_argument("--notes", type=int, default=20, help="Number of notes.")
+    parser.add_argument("--blocks", type=int, default=60, help="Blocks per note.")
+    parser.add_argument("--shared-images", type=int, default=2, help="Images repeated in every note.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (the fastest is kept).")
+    args = parser.parse_args()
+
+    documents = generate_notebook(args.notes, args.blocks, args.shared_images)
+
+    ExportAsPDF.warm_up()
+    ExportAsPDF.generate_pdf(documents[0], BytesIO())
+
+    separate_seconds = separate_bytes = 0
+    for document in documents:
+        seconds, size = measure(document, args.repeat)
+        separate_seconds += seconds
+        separate_bytes += size
+    combined_seconds, combined_bytes = measure(documents, args.repeat)
+
+    print(f"{'mode':<10}{'seconds':>10}{'size KB':>10}")
+    print(f"{'separate':<10}{separate_seconds:>10.3f}{separate_bytes / 1024:>10.1f}")
+    print(f"{'combined':<10}{combined_seconds:>10.3f}{combined_bytes / 1024:>10.1f}")
+    print(f"combined is {combined_bytes / separate_bytes:.0%} of the size, "
+          f"{combined_seconds / separate_seconds:.0%} of the time")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Benchmark dos perfis de saída (--output-profile)
+#
+# Uso: python benchmarks/bench_output_profiles.py [documento.json] [--blocks 300]
+#          [--repeat 3] [--bandwidth 10]
+#
+# Para cada perfil mede o tempo de exportação, o tamanho do PDF e os bytes
+# que o visualizador precisa receber antes de mostrar a página 1: o arquivo
+# inteiro num PDF comum (a tabela xref fica no fim) ou só a primeira seção
+# (/E do dicionário de linearização) num PDF linearizado. O tempo até a
+# primeira página é estimado como exportação + download desses bytes na
+# banda informada (Mbit/s).
+import argparse
+import os
+import re
+import sys
+import time
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import ExportAsPDF  # noqa: E402
+from synthetic import generate_document  # noqa: E402
+
+_linearized = re.compile(rb"/Linearized\s[^>]*?/E\s+(\d+)")
+
+# Bytes necessários antes de mostrar a página 1
+def first_page_bytes(pdf):
+    match = _linearized.search(pdf[:1024])
+    return int(match.group(1)) if match else len(pdf)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PDF output profiles.")
+    parser.add_argument("json_path", nargs="?", help="Editor.js document (default: a synthetic one).")
+    parser.add_argument("--blocks", type=int, default=300, help="Blocks of the synthetic document.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per profile (the fastest is kept).")
+    parser.add_argument("--bandwidth", type=float, default=10.0, help="Download speed in Mbit/s.")
+    args = parser.parse_args()
+
+    if args.json_path:
+        data = ExportAsPDF.load_json(args.json_path)
+    else:
+        data = generate_document(args.blocks)
+
+    ExportAsPDF.warm_up()
+
+    # Uma exportação descartada: todos os perfis medem com os caches já aquecidos
+    ExportAsPDF.generate_pdf(data, BytesIO())
+
+    bytes_per_second = args.bandwidth * 1_000_000 / 8
+    print(f"{'profile':<10}{'export s':>10}{'size KB':>10}{'1st page KB':>13}{'to 1st page s':>15}")
+    for name in ExportAsPDF.OUTPUT_PROFILES:
+        best = None
+        for _ in range(args.repeat):
+            output = BytesIO()
+            start = time.perf_counter()
+            ExportAsPDF.generate_pdf(data, output, name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        pdf = output.getvalue()
+        needed = first_page_bytes(pdf)
+        print(f"{name:<10}{best:>10.3f}{len(pdf) / 1024:>10.1f}{needed / 1024:>13.1f}"
+              f"{best + needed / bytes_per_second:>15.3f}")
+
+if __name__ == "__main__":
+    main()
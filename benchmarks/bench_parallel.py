@@ -0,0 +1,59 @@
+# Benchmark da renderização em paralelo de um documento grande (--jobs)
+#
+# Uso: python benchmarks/bench_parallel.py [documento.json] [--blocks 3000]
+#          [--jobs 1,2,4] [--repeat 1]
+#
+# Exporta o mesmo documento com cada número de processos e mostra o tempo,
+# o ganho em relação a um processo e o tamanho do PDF. Confere também que
+# todas as exportações têm o mesmo número de páginas (as quebras de página
+# não dependem de --jobs). Acima do número de CPUs, --jobs é limitado a ele.
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import pikepdf  # noqa: E402
+
+import ExportAsPDF  # noqa: E402
+from synthetic import generate_document  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rendering one large document with several processes.")
+    parser.add_argument("json_path", nargs="?", help="Editor.js document (default: a synthetic one).")
+    parser.add_argument("--blocks", type=int, default=3000, help="Blocks of the synthetic document.")
+    parser.add_argument("--jobs", default="1,2,4", help="Comma-separated process counts to compare.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per process count (the fastest is kept).")
+    args = parser.parse_args()
+
+    if args.json_path:
+        data = ExportAsPDF.load_json(args.json_path)
+    else:
+        data = generate_document(args.blocks)
+
+    ExportAsPDF.warm_up()
+
+    print(f"{'jobs':<6}{'seconds':>10}{'speedup':>10}{'pages':>8}{'size KB':>12}")
+    serial = None
+    for jobs in (int(value) for value in args.jobs.split(",")):
+        best = None
+        for _ in range(args.repeat):
+            output = BytesIO()
+            start = time.perf_counter()
+            ExportAsPDF.generate_pdf(data, output, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        pdf = output.getvalue()
+        with pikepdf.open(BytesIO(pdf)) as document:
+            pages = len(document.pages)
+        serial = serial or best
+        print(f"{jobs:<6}{best:>10.3f}{serial / best:>9.2f}x{pages:>8}{len(pdf) / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Benchmark de vazão do sanitize_html
+#
+# Uso: python benchmarks/bench_sanitize.py [quantidade_de_itens]
+#
+# Mede quantos itens de texto por segundo o sanitizador processa, com o
+# cache desligado (textos únicos) e com textos repetidos (cache quente).
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ExportAsPDF  # noqa: E402
+
+SAMPLES = [
+    'Plain list item with some words in it',
+    'Item with <b>bold</b>, <i>italic</i> and <u>underline</u>',
+    'Use <code class="inline-code">pip install</code> to <mark class="cdx-marker">install</mark>',
+    'See <a href="https://example.com/docs">the docs</a>&nbsp;for details',
+    'Line one<br>line two<br>line três 😀',
+]
+
+def make_items(count, unique):
+    rng = random.Random(0)
+    items = []
+    for index in range(count):
+        text = rng.choice(SAMPLES)
+        items.append(f"{text} #{index}" if unique else text)
+    return items
+
+def run(items):
+    ExportAsPDF.sanitize_html.cache_clear()
+    start = time.perf_counter()
+    for item in items:
+        ExportAsPDF.sanitize_html(item)
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    for label, unique in (("unique", True), ("repeated", False)):
+        elapsed = run(make_items(count, unique))
+        print(f"{label:>8}: {count} items in {elapsed:.3f}s ({count / elapsed:,.0f} items/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# Benchmark do tempo de inicialização (cold start)
+#
+# Uso: python benchmarks/bench_startup.py [--repeat 5] [--top 10]
+#          [--save results.json] [--baseline baseline.json] [--tolerance 0.2]
+#
+# Mede, sempre em processos novos:
+#   - o tempo de "import ExportAsPDF" (python -X importtime), com os módulos
+#     mais caros importados por ele;
+#   - o tempo total da linha de comando exportando uma nota só com texto e
+#     a nota de exemplo (dist/note.json), e a nota só com texto servida pelo
+#     cache de PDFs (--cache).
+# Também confere que a nota só com texto não carrega as bibliotecas que
+# deveriam ser importadas sob demanda (svglib, renderPDF, Pygments) e que
+# um acerto do cache não carrega o reportlab. O PIL é uma exceção
+# conhecida: o reportlab.lib.utils o importa no topo do módulo, então ele
+# é apenas informado, sem falhar a checagem.
+# Termina com código 1 se essa checagem falhar ou, com --baseline, se algum
+# tempo piorou além da tolerância.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+SCRIPT = os.path.join(ROOT, "ExportAsPDF.py")
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import generate_document  # noqa: E402
+
+# Módulos que uma nota só com texto não deve carregar
+LAZY_MODULES = ("svglib", "reportlab.graphics.renderPDF", "pygments")
+
+# Módulos de imagem que uma nota só com texto ainda carrega, e por quem
+KNOWN_EAGER_MODULES = {"PIL": "reportlab.lib.utils imports it at module level"}
+
+# Importa o módulo em um processo novo; retorna o tempo total (ms) e os filhos diretos mais caros
+def measure_import():
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ExportAsPDF"],
+                               cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+
+    # Cada linha: "import time: self | cumulative | <indentação>nome"
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    # Os filhos aparecem antes do pai: pega os de nível 1 logo antes do ExportAsPDF
+    end = next(index for index, (depth, name, _) in enumerate(entries) if name == "ExportAsPDF")
+    start = end
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    children = [(name, ms) for depth, name, ms in entries[start:end] if depth == 1]
+    return entries[end][2], children
+
+# Roda a linha de comando em um processo novo e mede o tempo total
+def measure_cli(json_path, output_path, extra=()):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, json_path, "-o", output_path, *extra], cwd=ROOT, check=True)
+    return (time.perf_counter() - start) * 1000
+
+# Exporta em um processo novo e lista quais módulos sob demanda foram carregados
+def loaded_lazy_modules(json_path):
+    code = (
+        "import json, sys\n"
+        "from io import BytesIO\n"
+        "import ExportAsPDF\n"
+        f"ExportAsPDF.generate_pdf(ExportAsPDF.load_json({json_path!r}), BytesIO())\n"
+        f"print(json.dumps([name for name in {LAZY_MODULES + tuple(KNOWN_EAGER_MODULES)!r} if name in sys.modules]))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                               stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout)
+
+# Exporta em um processo novo com o cache já preenchido; retorna se o reportlab foi carregado
+def cache_hit_loads_reportlab(json_path, cache_dir):
+    code = (
+        "import sys\n"
+        "from io import BytesIO\n"
+        "import ExportAsPDF\n"
+        f"ExportAsPDF.enable_pdf_cache({cache_dir!r})\n"
+        f"ExportAsPDF.generate_pdf(ExportAsPDF.load_json({json_path!r}), BytesIO())\n"
+        "print(ExportAsPDF.pdf_cache_stats()['process']['hits'], 'reportlab' in sys.modules)\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                               stdout=subprocess.PIPE, text=True, check=True)
+    hits, loaded = completed.stdout.split()
+    return hits != "1" or loaded == "True"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ExportAsPDF cold start.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the median is kept).")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against results saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown before a regression is reported (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    failed = False
+
+    # Tempo de import e os módulos mais caros (mediana das execuções)
+    import_runs = [measure_import() for _ in range(args.repeat)]
+    import_ms = statistics.median(total for total, _ in import_runs)
+    by_module = {}
+    for _, children in import_runs:
+        for name, ms in children:
+            by_module.setdefault(name, []).append(ms)
+    slowest = sorted(((statistics.median(times), name) for name, times in by_module.items()), reverse=True)
+
+    print(f"import ExportAsPDF: {import_ms:.1f} ms (median of {args.repeat})")
+    for ms, name in slowest[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    results = {"import_ms": import_ms}
+    with tempfile.TemporaryDirectory() as workdir:
+        text_path = os.path.join(workdir, "text.json")
+        document = generate_document(50, {"header": 1, "paragraph": 5, "list": 1, "quote": 1, "delimiter": 1})
+        with open(text_path, "w", encoding="utf-8") as file:
+            json.dump(document, file)
+
+        output_path = os.path.join(workdir, "out.pdf")
+        for name, json_path in (("cli_text_ms", text_path), ("cli_note_ms", os.path.join(ROOT, "dist", "note.json"))):
+            results[name] = statistics.median(measure_cli(json_path, output_path) for _ in range(args.repeat))
+            print(f"{name}: {results[name]:.1f} ms (median of {args.repeat})")
+
+        # Mesma nota servida pelo cache de PDFs (a primeira execução o preenche)
+        cache_dir = os.path.join(workdir, "cache")
+        measure_cli(text_path, output_path, ["--cache", cache_dir])
+        results["cli_cache_hit_ms"] = statistics.median(
+            measure_cli(text_path, output_path, ["--cache", cache_dir]) for _ in range(args.repeat))
+        print(f"cli_cache_hit_ms: {results['cli_cache_hit_ms']:.1f} ms (median of {args.repeat})")
+
+        # Checagem: a nota só com texto não carrega svglib, renderPDF nem Pygments
+        loaded = loaded_lazy_modules(text_path)
+        unexpected = [name for name in loaded if name not in KNOWN_EAGER_MODULES]
+        if unexpected:
+            print(f"[Error]: Text-only export loaded on-demand modules: {', '.join(unexpected)}", file=sys.stderr)
+            failed = True
+        else:
+            print("text-only export loaded none of: " + ", ".join(LAZY_MODULES))
+
+        # Checagem: o PIL, exceção conhecida, é só informado
+        for name, reason in KNOWN_EAGER_MODULES.items():
+            if name in loaded:
+                print(f"text-only export loaded {name} (known exception: {reason})")
+            else:
+                print(f"text-only export did not load {name}")
+
+        # Checagem: um acerto do cache não carrega o reportlab
+        if cache_hit_loads_reportlab(text_path, cache_dir):
+            print("[Error]: Export served from the PDF cache loaded reportlab (or missed the cache).",
+                  file=sys.stderr)
+            failed = True
+        else:
+            print("cache hit did not load reportlab")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        print()
+        for name, value in results.items():
+            old = baseline.get(name)
+            if not old:
+                continue
+            ratio = value / old
+            marker = "REGRESSION" if ratio > 1 + args.tolerance else ""
+            print(f"{name:<14}{old:>10.1f} -> {value:<10.1f}{ratio:>7.2f}x {marker}")
+            failed = failed or bool(marker)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# Gerador de documentos sintéticos do Editor.js para os benchmarks
+#
+# Uso: python benchmarks/synthetic.py -o doc.json [--blocks 500]
+#          [--mix paragraph=5,header=1,...] [--image-size 800x600]
+#          [--image-format jpeg] [--table-size 20x4] [--code-lines 40] [--seed 0]
+#
+# O mesmo seed gera sempre o mesmo documento, então os resultados de
+# execuções diferentes podem ser comparados.
+import argparse
+import base64
+import json
+import random
+import string
+from io import BytesIO
+
+# Proporção padrão de cada tipo de bloco (parecida com uma nota comum)
+DEFAULT_MIX = {
+    'paragraph': 10,
+    'header': 2,
+    'list': 2,
+    'checklist': 1,
+    'quote': 1,
+    'warning': 1,
+    'code': 1,
+    'delimiter': 1,
+    'table': 1,
+    'image': 1,
+}
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua exportação título "
+    "parágrafo código tabela imagem"
+).split()
+
+CODE_LINES = [
+    "def export(blocks, output):",
+    "    for index, block in enumerate(blocks):",
+    "        if block['type'] == 'paragraph':",
+    "            text = sanitize(block['data']['text'])  # remove tags",
+    "        total += len(text) * 2",
+    "    return {'pages': pages, \"size\": size}",
+    "",
+]
+
+# Lê uma proporção no formato "paragraph=5,header=1"
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown block type: {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+# Lê um tamanho no formato "800x600"
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+def block_id(rng):
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(10))
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+# Texto com formatação inline em parte das palavras
+def inline_text(rng, words):
+    parts = []
+    for _ in range(words):
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.05:
+            word = f"<b>{word}</b>"
+        elif roll < 0.10:
+            word = f"<i>{word}</i>"
+        elif roll < 0.12:
+            word = f'<a href="https://example.com/{word}">{word}</a>'
+        elif roll < 0.14:
+            word = f'<code class="inline-code">{word}</code>'
+        parts.append(word)
+    return ' '.join(parts)
+
+# Imagem com gradiente e ruído (comprime como uma foto, não como uma cor sólida)
+def make_image(rng, size, image_format):
+    from PIL import Image
+
+    width, height = size
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    img = Image.blend(img, noise, 0.3)
+    # Um pixel diferente por imagem: o PDF não pode reaproveitar a imagem anterior
+    img.putpixel((rng.randrange(width), rng.randrange(height)), (rng.randrange(256), 0, 0))
+
+    buffer = BytesIO()
+    pil_format = "JPEG" if image_format in ("jpg", "jpeg") else image_format.upper()
+    img.save(buffer, format=pil_format)
+    mime = "jpeg" if pil_format == "JPEG" else image_format.lower()
+    return f"data:image/{mime};base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def make_block(kind, rng, options):
+    if kind == 'paragraph':
+        data = {"text": inline_text(rng, rng.randint(20, 120))}
+    elif kind == 'header':
+        data = {"text": sentence(rng, rng.randint(2, 6)).title(), "level": rng.randint(1, 6)}
+    elif kind == 'list':
+        data = {"style": rng.choice(["ordered", "unordered"]),
+                "items": [inline_text(rng, rng.randint(3, 15)) for _ in range(rng.randint(3, 8))]}
+    elif kind == 'checklist':
+        data = {"items": [{"text": sentence(rng, rng.randint(2, 8)), "checked": rng.random() < 0.5}
+                          for _ in range(rng.randint(3, 8))]}
+    elif kind == 'quote':
+        data = {"text": sentence(rng, rng.randint(8, 30)), "caption": sentence(rng, 2).title(),
+                "alignment": rng.choice(["left", "center", "right"])}
+    elif kind == 'warning':
+        data = {"title": sentence(rng, 1).title(), "message": sentence(rng, rng.randint(5, 25))}
+    elif kind == 'code':
+        data = {"code": "\n".join(rng.choice(CODE_LINES) for _ in range(options["code_lines"])),
+                "language": "python"}
+    elif kind == 'delimiter':
+        data = {}
+    elif kind == 'table':
+        rows, cols = options["table_size"]
+        data = {"withHeadings": True,
+                "content": [[sentence(rng, rng.randint(1, 4)) for _ in range(cols)] for _ in range(rows)]}
+    elif kind == 'image':
+        data = {"url": make_image(rng, options["image_size"], options["image_format"]),
+                "caption": sentence(rng, 3)}
+    else:
+        raise ValueError(f"Unknown block type: {kind}")
+
+    return {"id": block_id(rng), "type": kind, "data": data}
+
+# Gera um documento do Editor.js com `blocks` blocos sorteados segundo `mix`
+def generate_document(blocks=200, mix=None, image_size=(800, 600), image_format="jpeg",
+                      table_size=(20, 4), code_lines=40, seed=0):
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = [kind for kind in mix if mix[kind] > 0]
+    weights = [mix[kind] for kind in kinds]
+    options = {
+        "image_size": image_size,
+        "image_format": image_format,
+        "table_size": table_size,
+        "code_lines": code_lines,
+    }
+
+    return {
+        "time": 1700000000000,
+        "blocks": [make_block(rng.choices(kinds, weights)[0], rng, options) for _ in range(blocks)],
+        "version": "2.28.2",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Editor.js document.")
+    parser.add_argument("-o", "--output", required=True, help="Where to write the JSON document.")
+    parser.add_argument("--blocks", type=int, default=200, help="Number of blocks.")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help='Block type weights, e.g. "paragraph=5,table=1".')
+    parser.add_argument("--image-size", type=parse_size, default=(800, 600), help="Image size in pixels (WxH).")
+    parser.add_argument("--image-format", default="jpeg", help="jpeg or png.")
+    parser.add_argument("--table-size", type=parse_size, default=(20, 4), help="Table rows x columns.")
+    parser.add_argument("--code-lines", type=int, default=40, help="Lines per code block.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    document = generate_document(args.blocks, args.mix, args.image_size, args.image_format,
+                                 args.table_size, args.code_lines, args.seed)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(document, file, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()